@@ -6,11 +6,18 @@ import pyarrow.fs as pafs
 import fsspec
 from pathlib import Path
 import pandas as pd
+from utils import FieldCache, ArchiveManifest, GribCache
 
 class Archiver(ABC):
     def __init__(self, config):
         self.config = config
         self.station_index_cache = {}
+        # optional decoded-field cache shared by process_files in the subclasses
+        self.field_cache = FieldCache(config.FIELD_CACHE, config.FIELD_CACHE_BYTES) if getattr(config, "USE_FIELD_CACHE", False) else None
+        # optional persistent cache of downloaded GRIB subsets and NDFD files
+        self.grib_cache = GribCache(config.GRIB_CACHE, config.GRIB_CACHE_BYTES) if getattr(config, "USE_GRIB_CACHE", False) else None
+        # resumable runs: per-source progress and checkpointed rows for each output file
+        self.manifest = ArchiveManifest(config.MANIFEST, config.CHECKPOINT_DIR) if getattr(config, "RESUME_ARCHIVING", False) else None
 
     @abstractmethod
     def fetch_file_list(self, start, end):
@@ -20,6 +27,91 @@ class Archiver(ABC):
     def process_files(self, file_list):
         pass
 
+    def process_checkpointed(self, job, sources, process_batch, batch_size, group_key=None, sizes=None):
+        """
+        Run process_batch over sources in batches of about batch_size, committing
+        each batch to the manifest before starting the next. process_batch(batch)
+        returns (df, failed sources); only the sources that succeeded are recorded,
+        so failed ones are retried by the next run. Sources the manifest already
+        has for this job are skipped. Sources with the same group_key are kept in
+        one batch (e.g. all forecast hours of a model run) and fail together, so a
+        retried group is processed whole again; process_batch must then leave the
+        whole group's rows out of df.
+        Returns the job's checkpointed rows not yet written to its output, including earlier runs'.
+        """
+        if self.manifest is None:
+            return process_batch(sources)[0]
+
+        done = self.manifest.completed_sources(job)
+        todo = [src for src in sources if src not in done]
+        if done:
+            print(f"⏩ Resuming: {len(sources) - len(todo)} of {len(sources)} source files already processed.")
+
+        batches, batch, last_key = [], [], None
+        for src in todo:
+            key = group_key(src) if group_key else None
+            if len(batch) >= batch_size and (group_key is None or key != last_key):
+                batches.append(batch)
+                batch = []
+            batch.append(src)
+            last_key = key
+        if batch:
+            batches.append(batch)
+
+        for n, batch in enumerate(batches, 1):
+            df, failed = process_batch(batch)
+            failed = set(failed)
+            if group_key and failed:
+                failed_groups = {group_key(src) for src in failed}
+                failed |= {src for src in batch if group_key(src) in failed_groups}
+            self.manifest.commit_batch(job, df, [src for src in batch if src not in failed], sizes=sizes)
+            print(f"💾 Checkpointed batch {n}/{len(batches)} ({len(batch) - len(failed)} files, {len(df)} rows"
+                  f"{f', {len(failed)} failed' if failed else ''})")
+
+        return self.manifest.load_parts(job)
+
+    def write_job_output(self, df, job, deduplicate=True, dataset=None):
+        """
+        Append df (from process_checkpointed) to job's output on S3 or locally, per
+        USE_CLOUD_STORAGE, and mark its checkpoint parts as written (and their sources
+        as extracted for dataset). Returns True if written.
+        """
+        parts = self.manifest.unwritten_parts(job) if self.manifest else []
+        if self.config.USE_CLOUD_STORAGE:
+            written = self.write_to_s3(df, job, deduplicate=deduplicate)
+        else:
+            written = self.write_local_output(df, job, deduplicate=deduplicate)
+        if written and self.manifest:
+            self.manifest.mark_written(job, parts, dataset)
+        return written
+
+    def output_exists(self, path, profile="default", region="us-east-2"):
+        if str(path).startswith("s3://"):
+            fs = fsspec.filesystem("s3", profile=profile, client_kwargs={"region_name": region})
+            return fs.exists(path)
+        return Path(path).exists()
+
+    def append_needs_dedup(self, job):
+        """
+        Whether appending to job's output has to de-duplicate: only skipped when the
+        output doesn't exist yet or the manifest already accounts for what is in it
+        (outputs written before the manifest, or on another host, are de-duplicated).
+        """
+        if self.manifest is None or not self.manifest.has_output(job):
+            return self.output_exists(job)
+        return False
+
+    def can_finalize(self, job, sources, period_end):
+        """
+        A job is only finalized once its period ended FINALIZE_AFTER_HOURS ago (so
+        late-arriving files still get picked up by reruns) and every source succeeded.
+        """
+        missing = set(sources) - self.manifest.completed_sources(job)
+        if missing:
+            print(f"⚠️ {len(missing)} source files failed; rerun to retry them.")
+        settled = pd.Timestamp(period_end) < pd.Timestamp.now("UTC").tz_localize(None) - pd.Timedelta(hours=self.config.FINALIZE_AFTER_HOURS)
+        return settled and not missing
+
     def write_partitioned_parquet(self, df, s3_uri, partition_cols):
         try:
             df["year"] = df["valid_time"].dt.year
@@ -37,7 +129,7 @@ class Archiver(ABC):
 
 
 
-    def write_to_s3(self, df, s3_path, profile="default", region="us-east-2"):
+    def write_to_s3(self, df, s3_path, profile="default", region="us-east-2", deduplicate=True):
         try:
             fs = fsspec.filesystem("s3", profile=profile, client_kwargs={"region_name": region})
             
@@ -46,8 +138,10 @@ class Archiver(ABC):
                 with fs.open(s3_path, "rb") as f:
                     existing_df = pd.read_parquet(f)
 
-                # Concatenate and drop duplicates if needed (optional)
-                combined_df = pd.concat([existing_df, df], ignore_index=True).drop_duplicates()
+                # Concatenate and drop duplicates unless the caller guarantees new rows only
+                combined_df = pd.concat([existing_df, df], ignore_index=True)
+                if deduplicate:
+                    combined_df = combined_df.drop_duplicates()
 
                 with fs.open(s3_path, "wb") as f:
                     combined_df.to_parquet(f, index=False)
@@ -57,12 +151,14 @@ class Archiver(ABC):
                     df.to_parquet(f, index=False)
 
             print(f"✅ Successfully wrote to {s3_path}")
+            return True
             
         except Exception as e:
             print(f"❌ Failed to write to S3: {e}")
+            return False
 
 
-    def write_local_output(self, df, local_path, dedup_columns=None):
+    def write_local_output(self, df, local_path, dedup_columns=None, deduplicate=True):
         """
         Save DataFrame locally to a Parquet file. If the file exists, append and de-duplicate.
         
@@ -70,28 +166,31 @@ class Archiver(ABC):
             df (pd.DataFrame): DataFrame to write
             local_path (str or Path): Path to local Parquet file
             dedup_columns (list or None): Columns to use for de-duplication. If None, all columns used.
+            deduplicate (bool): Set False when df is known to hold only new rows, to skip the full-table de-duplication.
+
+        Returns True if the file was written.
         """
         try:
             local_path = Path(local_path)
             local_path.parent.mkdir(parents=True, exist_ok=True)
 
             if local_path.exists():
-                print(f"ℹ️ File exists at {local_path}, appending and de-duplicating...")
+                print(f"ℹ️ File exists at {local_path}, appending{' and de-duplicating' if deduplicate else ''}...")
                 existing_df = pd.read_parquet(local_path)
                 combined_df = pd.concat([existing_df, df], ignore_index=True)
-                if dedup_columns:
-                    combined_df = combined_df.drop_duplicates(subset=dedup_columns)
-                else:
-                    combined_df = combined_df.drop_duplicates()
+                if deduplicate:
+                    combined_df = combined_df.drop_duplicates(subset=dedup_columns or None)
             else:
                 print(f"ℹ️ Creating new file at {local_path}...")
                 combined_df = df
 
             combined_df.to_parquet(local_path, index=False)
             print(f"📁 Saved locally: {local_path}")
+            return True
             
         except Exception as e:
             print(f"❌ Failed to write local file: {local_path} — {e}")
+            return False
 
     def append_to_parquet_s3(self, df_new, s3_path, unique_keys):
         try:
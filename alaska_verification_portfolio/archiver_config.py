@@ -15,7 +15,24 @@ MODEL_DIR = os.path.join(HOME, 'model')
 
 TMP = os.path.join(HOME, 'tmp_cache')
 
-for directory in [OBS, MODEL_DIR, TMP]:
+# persistent caches live outside TMP since the runners wipe TMP after every chunk
+CACHE = os.path.join(HOME, 'cache')
+
+INDEX_CACHE = os.path.join(CACHE, 'station_index')
+
+FIELD_CACHE = os.path.join(CACHE, 'fields')
+
+LISTING_CACHE = os.path.join(CACHE, 'listings')
+
+IDX_CACHE = os.path.join(CACHE, 'idx')
+
+GRIB_CACHE = os.path.join(CACHE, 'grib')
+
+# progress manifest and checkpointed rows for resumable runs
+MANIFEST = os.path.join(CACHE, 'manifest.sqlite')
+CHECKPOINT_DIR = os.path.join(CACHE, 'checkpoints')
+
+for directory in [OBS, MODEL_DIR, TMP, INDEX_CACHE]:
     os.makedirs(directory, exist_ok=True)
 ######################## File Names #################################
 
@@ -133,7 +150,7 @@ HERBIE_CYCLES = {"nbm": "6h","nbmqmd": "12h", "nbmqmd_exp": "12h", "hrrr": "6h",
 HERBIE_XARRAY_STRINGS = {'Wind': {'nbm': [':WIND:10 m above', ':WDIR:10 m above', ':GUST:10 m above'],
                                   'nbmqmd_exp': [':WIND:10 m above'],
 								   'hrrr': [':UGRD:10 m above',':VGRD:10 m above',':GUST:surface'],
-                                   'urma': []},
+                                   'urma': [':WIND:10 m above', ':WDIR:10 m above', ':GUST:10 m above']},
                         'precip24hr': {'nbmqmd': [':APCP:surface:'],
                                        'nbmqmd_exp': [':APCP:surface:']},
                         'precip6hr': {'nbmqmd': [':APCP:surface:'],
@@ -178,7 +195,7 @@ QMD_CYCLES = {
     }
 }
 
-HERBIE_REQUIRED_PHRASES = {'Wind': {'nbm': ['10 m above ground'], 'hrrr': ['10 m above ground']},
+HERBIE_REQUIRED_PHRASES = {'Wind': {'nbm': ['10 m above ground'], 'hrrr': ['10 m above ground'], 'urma': ['10 m above ground']},
                            'precip24hr': {'nbmqmd': ['APCP:surface']},
                            'precip6hr': {'nbmqmd': ['APCP:surface'], 'hrrr': ['APCP:surface']},
                            'snow6hr': {'nbmqmd': ['ASNOW:surface'], 'hrrr': ['ASNOW:surface']},
@@ -186,7 +203,7 @@ HERBIE_REQUIRED_PHRASES = {'Wind': {'nbm': ['10 m above ground'], 'hrrr': ['10 m
                            'maxt': {'nbmqmd': [':TMP:2 m above ground:']},
                            'mint': {'nbmqmd': [':TMP:2 m above ground:']}}
 
-HERBIE_EXCLUDE_PHRASES = {'Wind': {'nbm': ['ens std dev'], 'hrrr': ['ens std dev']},
+HERBIE_EXCLUDE_PHRASES = {'Wind': {'nbm': ['ens std dev'], 'hrrr': ['ens std dev'], 'urma': ['ens std dev']},
                           'precip24hr': {'nbmqmd': ['ens std dev']},
                           'precip6hr': {'nbmqmd': ['ens std dev'], 'hrrr': ['ens std dev']},
                           'snow6hr': {'nbmqmd': ['ens std dev'], 'hrrr': ['ens std dev']},
@@ -428,4 +445,98 @@ MODEL_URLS = {'nbm': "https://noaa-nbm-grib2-pds.s3.amazonaws.com",
 
 #################### Processing Params ########################
 # for process pool operations
-MAX_WORKERS = 8
\ No newline at end of file
+MAX_WORKERS = 8
+
+# for GRIB decoding in a process pool (1 = decode serially in the main process)
+DECODE_WORKERS = min(MAX_WORKERS, os.cpu_count() or 1)
+
+# hand each downloaded model file to a decoder as soon as it lands instead of downloading the whole chunk first
+STREAM_DOWNLOADS = True
+
+# max finished downloads queued for or in decoding at once when streaming (back-pressure on downloads)
+MAX_FILES_ON_DISK = 2 * MAX_WORKERS
+
+# keep byte-range GRIB subsets in memory and decode them from bytes instead of writing temp files
+# (urma still downloads whole files to disk)
+IN_MEMORY_GRIB = False
+
+# GRIB reader per model: "cfgrib" (xarray Dataset) or "pygrib" (direct message reader, skips the Dataset build)
+# nbmqmd/nbmqmd_exp always use pygrib; in-memory subsets (IN_MEMORY_GRIB) always use the pygrib reader
+GRIB_READERS = {
+    "nbm": "cfgrib",
+    "hrrr": "cfgrib",
+    "urma": "cfgrib",
+    "ndfd": "cfgrib"
+}
+
+# cache decoded GRIB fields on local disk (memory-mapped .npy) so new station lists don't re-download/re-decode
+USE_FIELD_CACHE = False
+
+# byte budget for the decoded-field cache; least recently used entries are evicted past this
+FIELD_CACHE_BYTES = 20 * 1024**3
+
+# concurrent HEAD requests when checking which model files exist
+PROBE_WORKERS = 32
+
+# how to find available model files: "listing" (one S3 prefix listing per directory) or "head" (one HEAD per .idx)
+FILE_LIST_METHOD = "listing"
+
+# bucket listings for data older than this many days are persisted and never re-listed
+LISTING_CACHE_DAYS = 2
+
+# idx byte ranges closer than this are fetched as one request
+RANGE_MERGE_GAP = 64 * 1024
+
+# concurrent range requests per GRIB file
+RANGE_FETCH_WORKERS = 4
+
+# try a single multi-range GET per file first (S3 does not support these)
+MULTIRANGE_REQUESTS = False
+
+# parsed .idx inventories kept in memory
+IDX_INVENTORY_ENTRIES = 512
+
+# cap on the on-disk .idx cache; least recently used files are dropped first
+IDX_CACHE_BYTES = 2 * 1024**3
+
+# (connect, read) timeout in seconds for HTTP requests that don't set their own
+HTTP_TIMEOUT = (10, 60)
+
+# HTTP retries on connection errors, 429 and 5xx (incl. S3 SlowDown), with exponential backoff
+HTTP_RETRIES = 5
+HTTP_BACKOFF = 0.5
+
+# resume interrupted runs from the manifest instead of redoing the whole month
+RESUME_ARCHIVING = True
+
+# source files per checkpoint batch
+CHECKPOINT_FILES = 64
+
+# months are only marked finalized (and skipped by reruns) once they ended this many hours ago
+FINALIZE_AFTER_HOURS = 48
+
+# keep downloaded GRIB subsets and NDFD files in GRIB_CACHE across chunks and reruns
+USE_GRIB_CACHE = False
+
+# byte budget for GRIB_CACHE; least recently used files are dropped first
+GRIB_CACHE_BYTES = 50 * 1024**3
+
+# let download/NDFD thread pools adapt their concurrency (starting at MAX_WORKERS) to observed throughput
+ADAPTIVE_CONCURRENCY = True
+ADAPTIVE_MIN_WORKERS = 2
+ADAPTIVE_MAX_WORKERS = 64
+
+# back off when more than this fraction of a window's tasks fail
+ADAPTIVE_FAILURE_FRACTION = 0.25
+
+# back off when median task latency exceeds the best seen by this factor without a throughput gain
+ADAPTIVE_LATENCY_FACTOR = 2.0
+
+# decode NDFD file pairs in DECODE_WORKERS processes instead of the MAX_WORKERS thread pool
+NDFD_PROCESS_DECODE = True
+
+# incremental NDFD ingest waits this long for the other components of an issuance before extracting it alone
+NDFD_INGEST_GRACE_HOURS = 12
+
+# failed attempts after which incremental ingest logs an issuance past the grace period and moves its watermark on
+NDFD_INGEST_MAX_ATTEMPTS = 3
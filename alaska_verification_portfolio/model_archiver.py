@@ -58,7 +58,7 @@ class ModelArchiver(Archiver):
         return meta_df
 
     def fetch_file_list(self, start, end):
-        return get_model_file_list(
+        file_urls, self.file_sizes = get_model_file_list(
             start=start,
             end=end,
             fcst_hours=self.config.HERBIE_FORECASTS[self.config.MODEL][self.wxelement],
@@ -66,17 +66,23 @@ class ModelArchiver(Archiver):
             base_url=self.config.MODEL_URLS[self.config.MODEL],
             element = self.config.ELEMENT,
             model=self.config.MODEL,
-            domain=self.config.HERBIE_DOMAIN
+            domain=self.config.HERBIE_DOMAIN,
+            return_sizes=True
         )
+        return file_urls
 
-    def process_files(self, file_urls):
+    def process_files(self, file_urls, return_failed=False):
         return extract_model_subset_parallel(
             file_urls=file_urls,
             station_df=self.station_df,
             search_strings=self.config.HERBIE_XARRAY_STRINGS[self.config.ELEMENT][self.config.MODEL],
             element=self.config.ELEMENT,
             model=self.config.MODEL,
-            config=self.config
+            config=self.config,
+            field_cache=self.field_cache,
+            file_sizes=getattr(self, "file_sizes", None),
+            grib_cache=self.grib_cache,
+            return_failed=return_failed
         )
 
 if __name__ == "__main__":
@@ -3,7 +3,7 @@ import os
 import sys
 import pandas as pd
 from pathlib import Path
-from utils import get_ndfd_file_list, extract_ndfd_forecasts_parallel, create_wind_metadata, parse_metadata, create_precip_metadata
+from utils import get_ndfd_file_list, extract_ndfd_forecasts_parallel, create_wind_metadata, parse_metadata, create_precip_metadata, ndfd_file_table
 
 class NDFDArchiver(Archiver):
     def __init__(self, config, start=None, wxelement=None):
@@ -61,7 +61,120 @@ class NDFDArchiver(Archiver):
     def fetch_file_list(self, start, end):
         return get_ndfd_file_list(start, end, self.config.NDFD_DICT, self.config.ELEMENT)
 
-    def process_files(self, file_list):
+    def output_path(self, when):
+        """Monthly partition that forecasts issued in when's month are written to."""
+        filename = f"{when.year}_{when.month:02d}_ndfd_{self.wxelement.lower()}_archive.parquet"
+        if self.config.USE_CLOUD_STORAGE:
+            return f"{self.config.S3_URLS['ndfd']}{filename}"
+        return os.path.join(self.config.NDFD_DIR, self.wxelement.lower(), filename)
+
+    def dataset_key(self, output_path):
+        """Manifest key shared by every monthly partition of this element's archive."""
+        return f"ndfd/{self.wxelement.lower()}|{os.path.dirname(output_path)}"
+
+    def ingest_new_issuances(self, now=None):
+        """
+        Extract only the issuances that haven't been ingested yet and append them to their
+        month's partition, so a daily cron run lists and decodes just the new 11Z/23Z files.
+
+        Each component keeps a watermark below which every issuance is in. A run lists
+        back NDFD_INGEST_GRACE_HOURS behind it, so objects that land late (e.g. the other
+        WMO stream of an issuance) are still found, and skips what the extracted ledger
+        already has. The first run starts at the beginning of the current month. Failed
+        attempts are counted per issuance; after NDFD_INGEST_MAX_ATTEMPTS, once past the
+        grace period, an issuance is logged and the watermark moves past it.
+        Returns the number of rows appended.
+        """
+        if self.manifest is None:
+            print("❌ Incremental ingest needs RESUME_ARCHIVING on; watermarks are kept in the manifest.")
+            return 0
+        now = now or pd.Timestamp.now("UTC").tz_localize(None)
+        grace = pd.Timedelta(hours=self.config.NDFD_INGEST_GRACE_HOURS)
+        components = self.config.NDFD_FILE_STRINGS[self.wxelement]
+        key = components[0]
+        names = {c: f"ndfd/{self.wxelement.lower()}/{c}" for c in components}
+        marks = [self.manifest.watermark(names[c]) for c in components]
+        if any(mark is None for mark in marks):
+            window_start = now.normalize().replace(day=1) - pd.Timedelta(minutes=1)
+        else:
+            window_start = min(marks) - grace
+
+        print(f"\n🔎 Listing {self.wxelement} issuances after {window_start:%Y-%m-%d %H:%M}")
+        file_list = get_ndfd_file_list(window_start.normalize().strftime("%Y%m%d%H%M"), now.strftime("%Y%m%d%H%M"),
+                                       self.config.NDFD_DICT, self.wxelement, lookback_days=0)
+        tables = {}
+        for c in components:
+            files = ndfd_file_table(file_list.get(c, [])).dropna(subset=["time"])
+            tables[c] = files[files["time"] > window_start].sort_values("time", kind="stable")
+
+        dataset = self.dataset_key(self.output_path(now))
+        new = tables[key][~tables[key]["file"].isin(self.manifest.extracted_sources(dataset))]
+        max_attempts = self.config.NDFD_INGEST_MAX_ATTEMPTS
+        gave_up = [f for f, n in self.manifest.failure_counts(dataset).items() if n >= max_attempts]
+        skipped = (new["time"] <= now - grace) & new["file"].isin(gave_up)
+        if skipped.any():
+            print(f"⏩ Skipping {skipped.sum()} issuances given up after {max_attempts} failed attempts.")
+            new = new[~skipped]
+
+        # hold back issuances whose other components have not landed yet, up to the grace period
+        ready = pd.Series(True, index=new.index)
+        for c in components[1:]:
+            partner = pd.merge_asof(new[["time", "stream"]], tables[c][["time", "stream"]].rename(columns={"time": "partner_time"}),
+                                    left_on="time", right_on="partner_time", by="stream",
+                                    direction="nearest", tolerance=pd.Timedelta("2 minutes"))
+            ready &= partner["partner_time"].notna().to_numpy()
+        ready |= new["time"] <= now - grace
+        held = new[~ready]
+        new = new[ready]
+        if new.empty:
+            print(f"ℹ️ No new {self.wxelement} issuances to ingest ({len(held)} waiting for other components).")
+            return 0
+
+        rows, failed = 0, set()
+        for month, batch in new.groupby(new["time"].dt.to_period("M")):
+            output_path = self.output_path(month.start_time)
+            sources = batch["file"].tolist()
+            print(f"📥 Appending {len(sources)} new issuances to {output_path}")
+            df, batch_failed = self.process_files({**{c: files["file"].tolist() for c, files in tables.items()}, key: sources},
+                                                  return_failed=True)
+            if df.empty:
+                failed.update(sources)
+                continue
+            deduplicate = self.append_needs_dedup(output_path)
+            if self.config.USE_CLOUD_STORAGE:
+                written = self.write_to_s3(df, output_path, deduplicate=deduplicate)
+            else:
+                written = self.write_local_output(df, output_path, deduplicate=deduplicate)
+            if not written:
+                failed.update(sources)
+                continue
+            self.manifest.mark_extracted(dataset, output_path, [f for f in sources if f not in set(batch_failed)])
+            failed.update(batch_failed)
+            rows += len(df)
+
+        # an issuance that keeps failing past the grace period is logged and let go, so it can't pin the watermark
+        failures = self.manifest.record_failures(dataset, sorted(failed)) if failed else {}
+        expired = set(new.loc[new["time"] <= now - grace, "file"])
+        given_up = {f for f, n in failures.items() if n >= max_attempts and f in expired}
+        if given_up:
+            print(f"⚠️ Giving up on {len(given_up)} issuances after {max_attempts} failed attempts "
+                  f"(a monthly run can still pick them up): {sorted(given_up)}")
+        failed -= given_up
+
+        # the watermark only moves over issuances that are in, so failed and held-back ones get listed again
+        blocked = pd.concat([new.loc[new["file"].isin(failed), "time"], held["time"]])
+        done = new[~new["file"].isin(failed)]
+        if not blocked.empty:
+            done = done[done["time"] < blocked.min()]
+        if not done.empty:
+            for c in components:
+                self.manifest.set_watermark(names[c], done["time"].max())
+        if failed:
+            print(f"⚠️ {len(failed)} issuances failed; they will be retried next run.")
+        print(f"✅ Appended {rows} rows from {len(new) - len(failed) - len(given_up)} issuances.")
+        return rows
+
+    def process_files(self, file_list, return_failed=False):
         if self.config.ELEMENT == "Wind":
             speed_key, dir_key = self.config.NDFD_FILE_STRINGS[self.config.ELEMENT]
         elif self.config.ELEMENT == "Gust":
@@ -84,5 +197,6 @@ class NDFDArchiver(Archiver):
             sys.exit()
         speed_files = file_list[speed_key]
         dir_files = file_list.get(dir_key, [])
-        return extract_ndfd_forecasts_parallel(speed_files, dir_files, self.station_df, tmp_dir=self.config.TMP)
+        return extract_ndfd_forecasts_parallel(speed_files, dir_files, self.station_df, tmp_dir=self.config.TMP, field_cache=self.field_cache,
+                                               grib_cache=self.grib_cache, return_failed=return_failed)
 
@@ -1,9 +1,9 @@
-import requests
 import pandas as pd
 import archiver_config as config
 from time import sleep
 from datetime import datetime, timedelta
 from archiver_base import Archiver
+from utils import http_get
 
 class ObsArchiver(Archiver):
     def __init__(self, config):
@@ -30,7 +30,7 @@ class ObsArchiver(Archiver):
             "complete": "1",
             "format": "json"
         }
-        response = requests.get(self.metadata_url, params=params)
+        response = http_get(self.metadata_url, params=params)
         response.raise_for_status()
         metadata = response.json()
         stations = metadata.get("STATION", [])
@@ -100,7 +100,7 @@ class ObsArchiver(Archiver):
                         "units": units_param,
                         "output": "json",
                     }
-                    r = requests.get(base_url, params=params, timeout=60)
+                    r = http_get(base_url, params=params, timeout=60)
                     r.raise_for_status()
                     js = r.json()
                     df_int = self._process_precip_json_for_rolling(js)  # helper below
@@ -219,7 +219,7 @@ class ObsArchiver(Archiver):
                         "output": "json",
                         "hfmetars": self.hfmetar,
                     }
-                    r = requests.get(self.url, params=params, timeout=60)
+                    r = http_get(self.url, params=params, timeout=60)
                     r.raise_for_status()
                     js = r.json()
 
@@ -350,7 +350,7 @@ class ObsArchiver(Archiver):
                         "output": "json",
                         "hfmetars": self.hfmetar,
                     }
-                    r = requests.get(self.url, params=params, timeout=60)
+                    r = http_get(self.url, params=params, timeout=60)
                     r.raise_for_status()
                     js = r.json()
 
@@ -442,7 +442,7 @@ class ObsArchiver(Archiver):
                         "obtimezone": "utc",
                         "output": "json"
                     }
-                    r = requests.get(self.url, params=params)
+                    r = http_get(self.url, params=params)
                     r.raise_for_status()
                     obs_json = r.json()
                     df = self.process_obs_data(obs_json["STATION"])
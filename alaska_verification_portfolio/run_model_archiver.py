@@ -1,6 +1,7 @@
 import argparse
 import tempfile
 from model_archiver import ModelArchiver
+from utils import warm_idx_cache, parse_date_and_time_from_url
 import archiver_config as config
 import pandas as pd
 from dateutil.relativedelta import relativedelta
@@ -12,7 +13,7 @@ import sys
 os.makedirs(config.TMP, exist_ok=True)
 tempfile.tempdir = config.TMP
 
-def run_monthly_archiving(start, end, model_name, element, use_local):
+def run_monthly_archiving(start, end, model_name, element, use_local, warm_idx_only=False, restart=False):
 
     # Normalize to match config keys
     model = model_name.lower()
@@ -44,28 +45,47 @@ def run_monthly_archiving(start, end, model_name, element, use_local):
             chunk_end = end
 
         print(f"\n📆 Processing {model_name.upper()} {element} from {current:%Y-%m-%d} to {chunk_end:%Y-%m-%d}")
+        if config.USE_CLOUD_STORAGE:
+            output_path = f"{config.S3_URLS[config.MODEL]}{current.year}_{current.month:02d}_{model}_{element.lower()}_archive.parquet"
+        else:
+            output_path = os.path.join(
+                config.MODEL_DIR,
+                model,
+                element.lower(),
+                f"{current.year}_{current.month:02d}_archive.parquet"
+            )
+        if archiver.manifest and restart and not warm_idx_only:
+            archiver.manifest.reset(output_path)
+
+        if archiver.manifest and not warm_idx_only and archiver.manifest.is_finalized(output_path):
+            print(f"⏭️ Already archived to {output_path} (use --restart to redo).")
+            current += relativedelta(months=1)
+            continue
+
         file_urls = archiver.fetch_file_list(current, chunk_end)
         #print(f'File urls are: {file_urls}')
-        if not file_urls:
+        if warm_idx_only:
+            warm_idx_cache(file_urls, max_workers=config.PROBE_WORKERS)
+        elif not file_urls:
             print("⚠️ No files found for this chunk.")
         else:
-            df = archiver.process_files(file_urls)
+            df = archiver.process_checkpointed(
+                output_path,
+                file_urls,
+                lambda batch: archiver.process_files(batch, return_failed=True),
+                batch_size=config.CHECKPOINT_FILES,
+                group_key=lambda url: parse_date_and_time_from_url(url, model),
+                sizes=archiver.file_sizes
+            )
             #print(f'Dataframe is: {df[df['station_id']=='PAAQ'].head(10)}')
             #df.to_csv('test.csv')
+            written = True
             if df.empty:
-                print("⚠️ No data extracted for this chunk.")
+                print("⚠️ No new data extracted for this chunk.")
             else:
-                if config.USE_CLOUD_STORAGE:
-                    s3_path = f"{config.S3_URLS[config.MODEL]}{current.year}_{current.month:02d}_{model}_{element.lower()}_archive.parquet"
-                    archiver.write_to_s3(df, s3_path)
-                else:
-                    local_path = os.path.join(
-                        config.MODEL_DIR,
-                        model,
-                        element.lower(),
-                        f"{current.year}_{current.month:02d}_archive.parquet"
-                    )
-                    archiver.write_local_output(df, local_path)
+                written = archiver.write_job_output(df, output_path)
+            if archiver.manifest and written and archiver.can_finalize(output_path, file_urls, chunk_end):
+                archiver.manifest.finalize(output_path)
 
         shutil.rmtree(config.TMP, ignore_errors=True)
         os.makedirs(config.TMP, exist_ok=True)
@@ -83,6 +103,16 @@ if __name__ == "__main__":
         action="store_true",
         help="If set, store output locally instead of S3 (overrides USE_CLOUD_STORAGE)"
     )
+    parser.add_argument(
+        "--warm-idx-cache",
+        action="store_true",
+        help="Only prefetch the .idx files for the date range into the local idx cache, then exit"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Ignore checkpoints from earlier runs and reprocess every month in the range"
+    )
 
     args = parser.parse_args()
     start = pd.to_datetime(args.start)
@@ -93,4 +123,4 @@ if __name__ == "__main__":
         raise NotImplementedError
     #print(args.element.title())
 
-    run_monthly_archiving(start, end, args.model, args.element, args.local)
\ No newline at end of file
+    run_monthly_archiving(start, end, args.model, args.element, args.local, args.warm_idx_cache, args.restart)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import argparse
 import tempfile
 from ndfd_archiver import NDFDArchiver
+from utils import ndfd_file_table
 import archiver_config as config
 import pandas as pd
 from dateutil.relativedelta import relativedelta
@@ -12,7 +13,7 @@ import sys
 os.makedirs(config.TMP, exist_ok=True)
 tempfile.tempdir = config.TMP
 
-def run_monthly_archiving(start, end, element, use_local):
+def normalize_element(element):
     # Normalize element (e.g., wind → Wind)
     if element.lower() == "wind" or element.lower == "gust":
         element = element.capitalize()  # "wind" → "Wind", etc.
@@ -20,7 +21,22 @@ def run_monthly_archiving(start, end, element, use_local):
     if element not in config.NDFD_FILE_STRINGS:
         print(f"❌ Element '{element}' not recognized. Valid options: {list(config.NDFD_FILE_STRINGS.keys())}")
         sys.exit(1)
+    return element
 
+def run_incremental_ingest(element, use_local):
+    element = normalize_element(element)
+    config.ELEMENT = element
+    config.USE_CLOUD_STORAGE = not use_local
+
+    now = pd.Timestamp.now("UTC").tz_localize(None)
+    archiver = NDFDArchiver(config, start=now.replace(day=1).strftime("%Y%m%d%H%M"))
+    archiver.ingest_new_issuances(now)
+
+    shutil.rmtree(config.TMP, ignore_errors=True)
+    os.makedirs(config.TMP, exist_ok=True)
+
+def run_monthly_archiving(start, end, element, use_local, restart=False):
+    element = normalize_element(element)
     config.ELEMENT = element
     config.USE_CLOUD_STORAGE = not use_local
 
@@ -33,23 +49,53 @@ def run_monthly_archiving(start, end, element, use_local):
             chunk_end = end
 
         print(f"\n📆 Processing {element} from {current:%Y-%m-%d} to {chunk_end:%Y-%m-%d}")
+        output_path = archiver.output_path(current)
+        if archiver.manifest and restart:
+            archiver.manifest.reset(output_path)
+
+        if archiver.manifest and archiver.manifest.is_finalized(output_path):
+            print(f"⏭️ Already archived to {output_path} (use --restart to redo).")
+            current += relativedelta(months=1)
+            continue
+
         filtered_files = archiver.fetch_file_list(current.strftime("%Y%m%d%H%M"), chunk_end.strftime("%Y%m%d%H%M"))
         #print(filtered_files)
         #sys.exit(1)
         file_key = config.NDFD_FILE_STRINGS[element][0]
-        if not filtered_files[file_key]:
+        sources = filtered_files[file_key]
+        dataset = archiver.dataset_key(output_path)
+        if archiver.manifest:
+            # each issuance belongs to its issuance month's job, as in ingest_new_issuances, so the
+            # 3-day lookback only feeds pairing and the result doesn't depend on the order months run in
+            issued = ndfd_file_table(sources)["time"]
+            sources = [f for f, t in zip(sources, issued) if current <= t <= chunk_end]
+            extracted = archiver.manifest.extracted_sources(dataset)
+            if extracted:
+                n_sources = len(sources)
+                sources = [f for f in sources if f not in extracted]
+                print(f"⏩ Skipping {n_sources - len(sources)} issuances already extracted by earlier runs or ingests.")
+        if not sources:
             print(f"⚠️ No data for {current} to {chunk_end}")
         else:
-            df = archiver.process_files(filtered_files)
+            # checkpoint on the primary component; each batch is paired against all the other files
+            df = archiver.process_checkpointed(
+                output_path,
+                sources,
+                lambda batch: archiver.process_files({**filtered_files, file_key: batch}, return_failed=True),
+                batch_size=config.CHECKPOINT_FILES
+            )
             #print(f'Dataframe is: {df[df['station_id']=='PAJN'].head(10)}')
-            filename = f"{current.year}_{current.month:02d}_ndfd_{element.lower()}_archive.parquet"
 
-            if config.USE_CLOUD_STORAGE:
-                s3_url = f"{config.S3_URLS["ndfd"]}{filename}"
-                archiver.write_to_s3(df, s3_url)
+            # with the manifest every issuance is extracted exactly once, so writes are plain appends
+            # unless the output holds rows the manifest doesn't know about
+            written = True
+            if df.empty:
+                print(f"⚠️ No new data extracted for {current} to {chunk_end}")
             else:
-                local_path = os.path.join(config.NDFD_DIR, element.lower(), filename)
-                archiver.write_local_output(df, local_path)
+                written = archiver.write_job_output(df, output_path, deduplicate=archiver.append_needs_dedup(output_path),
+                                                    dataset=dataset)
+            if archiver.manifest and written and archiver.can_finalize(output_path, sources, chunk_end):
+                archiver.manifest.finalize(output_path)
 
         shutil.rmtree(config.TMP, ignore_errors=True)
         os.makedirs(config.TMP, exist_ok=True)
@@ -59,13 +105,21 @@ def run_monthly_archiving(start, end, element, use_local):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="NDFD Archiver")
-    parser.add_argument("--start", required=True, help="Start date (e.g. 2022-01-01 or 2022-01-01 00:00)")
-    parser.add_argument("--end", required=True, help="End date (e.g. 2022-02-01)")
+    parser.add_argument("--start", help="Start date (e.g. 2022-01-01 or 2022-01-01 00:00)")
+    parser.add_argument("--end", help="End date (e.g. 2022-02-01)")
     parser.add_argument("--element", required=True, help="Forecast element (e.g. Wind, Gust)")
     parser.add_argument("--local", action="store_true", help="Write output locally instead of to S3")
+    parser.add_argument("--restart", action="store_true", help="Ignore checkpoints from earlier runs and reprocess every month in the range")
+
+    parser.add_argument("--incremental", action="store_true", help="Append only issuances newer than the last run's watermark (for a daily cron job)")
 
     args = parser.parse_args()
+    if args.incremental:
+        run_incremental_ingest(args.element, args.local)
+        sys.exit(0)
+    if not args.start or not args.end:
+        parser.error("--start and --end are required unless --incremental is given")
     start = pd.to_datetime(args.start)
     end = pd.to_datetime(args.end)
 
-    run_monthly_archiving(start, end, args.element, args.local)
+    run_monthly_archiving(start, end, args.element, args.local, args.restart)
@@ -1,21 +1,62 @@
 import os
+import io
 import sys
 import re
 import tempfile
 import shutil
+import hashlib
+import json
+import threading
+import time
+import sqlite3
+import contextlib
+import multiprocessing
 import pygrib
+import pyproj
 import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter, Retry
 import fsspec
 import xarray as xr
-from datetime import datetime
+from datetime import datetime, timezone
 from pathlib import Path
 from scipy.spatial import cKDTree
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import archiver_config as config  # Update 'your_module' with actual config import path
 
+# in-memory layer over the on-disk station index cache, keyed by (grid signature, station signature)
 station_index_cache = {}
+station_index_lock = threading.Lock()
+
+# parsed .idx inventories keyed by idx URL (see load_idx_inventory)
+idx_inventory_cache = {}
+idx_inventory_lock = threading.Lock()
+
+# shared HTTP session (see get_http_session)
+http_session_state = {"session": None}
+http_session_lock = threading.Lock()
+
+# counters fed by http_request and s3_request_stats for AdaptiveConcurrency
+http_stats = {"requests": 0, "bytes": 0, "throttled": 0}
+http_stats_lock = threading.Lock()
+
+# running size of the on-disk idx cache (see fetch_idx_text)
+idx_cache_size = {"bytes": None}
+idx_cache_lock = threading.Lock()
+
+# GRIB keys that define a grid; used for the grid signature and analytic indexing
+GRID_SIGNATURE_KEYS = [
+    "gridType", "Nx", "Ny", "Ni", "Nj", "numberOfDataPoints", "shapeOfTheEarth",
+    "latitudeOfFirstGridPointInDegrees", "longitudeOfFirstGridPointInDegrees",
+    "latitudeOfLastGridPointInDegrees", "longitudeOfLastGridPointInDegrees",
+    "LaDInDegrees", "LoVInDegrees", "Latin1InDegrees", "Latin2InDegrees",
+    "DxInMetres", "DyInMetres",
+    "iScansNegatively", "jScansPositively", "jPointsAreConsecutive",
+]
+
+# regular projected grids where station indices can be computed in closed form
+ANALYTIC_GRID_TYPES = ["polar_stereographic", "lambert"]
 
 def K_to_F(kelvin):
   fahrenheit = 1.8*(kelvin-273)+32.
@@ -33,6 +74,32 @@ def MM_to_IN(mm):
 def M_to_IN(m):
     return m*39.3701
 
+# NDFD element -> (output column, unit conversion, decimals)
+NDFD_CONVERSIONS = {
+    "Wind": ("wind_speed_kt", MS_to_KTS, 2),
+    "Gust": ("wind_gust_kt", MS_to_KTS, 2),
+    "precip6hr": ("precip6hr", MM_to_IN, 2),
+    "maxt": ("maxt", K_to_F, 2),
+    "mint": ("mint", K_to_F, 2),
+    "snow6hr": ("snow6hr", M_to_IN, 1),
+}
+
+def latlon_to_xyz(lats, lons):
+    """
+    Convert lat/lon (degrees) to 3D cartesian points on the unit sphere.
+    Distances between these points are monotonic with great-circle distance,
+    so nearest-neighbour queries are not distorted by longitude convergence
+    or the 0–360 vs -180–180 longitude convention.
+    """
+    lat_r = np.radians(np.asarray(lats, dtype=np.float64))
+    lon_r = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat_r)
+    return np.column_stack((
+        (cos_lat * np.cos(lon_r)).ravel(),
+        (cos_lat * np.sin(lon_r)).ravel(),
+        np.sin(lat_r).ravel(),
+    ))
+
 def build_kdtree(lats, lons):
     """
     Build a cKDTree from 2D lat/lon arrays.
@@ -40,19 +107,22 @@ def build_kdtree(lats, lons):
         tree: cKDTree object
         shape: original shape of the lat/lon grids
     """
-    latlon_points = np.column_stack((lats.ravel(), lons.ravel()))
-    tree = cKDTree(latlon_points)
+    lons = normalize_lons_to_minus180_180(lons)
+    tree = cKDTree(latlon_to_xyz(lats, lons))
     return tree, lats.shape
 
 def query_kdtree(tree, shape, station_lat, station_lon):
     """
-    Query cKDTree and return 2D grid indices (iy, ix)
+    Query cKDTree and return 2D grid indices (iy, ix).
+    Accepts scalars or arrays of station lat/lons.
     """
-    dist, idx = tree.query([station_lat, station_lon])
+    station_lon = normalize_lons_to_minus180_180(np.atleast_1d(station_lon))
+    dist, idx = tree.query(latlon_to_xyz(np.atleast_1d(station_lat), station_lon))
     iy, ix = np.unravel_index(idx, shape)
+    if np.ndim(station_lat) == 0:
+        return int(iy[0]), int(ix[0])
     return iy, ix
 
-
 def normalize_lons_to_minus180_180(lons):
     """Shift lons from [0, 360] to [-180, 180] only if needed."""
     if np.nanmin(lons) >= 0:
@@ -70,6 +140,506 @@ def ll_to_index(loclat, loclon, datalats, datalons):
     latlon_idx = np.unravel_index(latlon_idx_flat, datalons.shape)
     return latlon_idx
 
+def stations_to_indices(station_df, lats, lons, cache=None):
+    """
+    Batched nearest-gridpoint lookup for every station in station_df.
+
+    Builds one KD-tree over the grid and queries all stations not already in
+    `cache` (dict of stid -> (iy, ix)) in a single call.
+
+    Returns:
+        iy, ix: integer arrays aligned with station_df rows
+    """
+    stids = station_df["stid"].to_numpy()
+    if cache is None:
+        cache = {}
+    missing = np.array([stid not in cache for stid in stids], dtype=bool)
+    if missing.any():
+        tree, shape = build_kdtree(np.asarray(lats), np.asarray(lons))
+        new_iy, new_ix = query_kdtree(
+            tree, shape,
+            station_df["latitude"].to_numpy(dtype=np.float64)[missing],
+            station_df["longitude"].to_numpy(dtype=np.float64)[missing],
+        )
+        for stid, y, x in zip(stids[missing], new_iy, new_ix):
+            cache[stid] = (int(y), int(x))
+    iy = np.fromiter((cache[stid][0] for stid in stids), dtype=np.intp, count=len(stids))
+    ix = np.fromiter((cache[stid][1] for stid in stids), dtype=np.intp, count=len(stids))
+    return iy, ix
+
+def read_grid_definition(grb):
+    """
+    Read the grid definition off a pygrib message without decoding its values.
+    Returns a dict of GRID_SIGNATURE_KEYS plus the pyproj projection parameters.
+    """
+    grid = {k: grb[k] for k in GRID_SIGNATURE_KEYS if grb.has_key(k)}
+    try:
+        grid["projparams"] = dict(grb.projparams) if grb.projparams else None
+    except Exception:
+        grid["projparams"] = None
+    return grid
+
+def read_grid_definition_from_file(grib_file):
+    """
+    Read the grid definition from the first message of a GRIB file.
+    Returns (grid, latlons) where latlons is a callable giving the 2D lat/lon
+    arrays, only needed when the grid can't be indexed analytically.
+    """
+    with pygrib.open(grib_file) as grbs:
+        grb = grbs.message(1)
+    return read_grid_definition(grb), grb.latlons
+
+def grid_signature(grid):
+    """Hash a grid definition. Two files on the same grid always produce the same signature."""
+    parts = [f"{k}={grid[k]}" for k in sorted(grid) if k != "projparams"]
+    parts += [f"{k}={v}" for k, v in sorted((grid.get("projparams") or {}).items())]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+def grid_is_analytic(grid):
+    """True if station indices on this grid can be computed in closed form."""
+    required = ["Nx", "Ny", "DxInMetres", "DyInMetres",
+                "latitudeOfFirstGridPointInDegrees", "longitudeOfFirstGridPointInDegrees"]
+    if grid.get("gridType") not in ANALYTIC_GRID_TYPES or not grid.get("projparams"):
+        return False
+    if any(k not in grid for k in required):
+        return False
+    # only the standard scan order (west→east rows, south→north) matches the array layout
+    scan = (grid.get("iScansNegatively", 0), grid.get("jScansPositively", 1), grid.get("jPointsAreConsecutive", 0))
+    return scan == (0, 1, 0)
+
+def analytic_station_indices(station_df, grid):
+    """
+    Map station lat/lons to (iy, ix) in closed form on a regular projected grid
+    (polar stereographic or Lambert) using the GRIB projection parameters.
+    Returns None when the grid can't be handled analytically.
+    """
+    if not grid_is_analytic(grid):
+        return None
+
+    proj = pyproj.Proj(grid["projparams"])
+    x0, y0 = proj(grid["longitudeOfFirstGridPointInDegrees"], grid["latitudeOfFirstGridPointInDegrees"])
+    x, y = proj(station_df["longitude"].to_numpy(dtype=np.float64),
+                station_df["latitude"].to_numpy(dtype=np.float64))
+    ix = np.rint((np.asarray(x) - x0) / grid["DxInMetres"]).astype(np.intp)
+    iy = np.rint((np.asarray(y) - y0) / grid["DyInMetres"]).astype(np.intp)
+    np.clip(ix, 0, grid["Nx"] - 1, out=ix)
+    np.clip(iy, 0, grid["Ny"] - 1, out=iy)
+    return iy, ix
+
+def station_signature(station_df):
+    """Hash the station ids and locations so the index cache invalidates when the metadata changes."""
+    hashed = pd.util.hash_pandas_object(station_df[["stid", "latitude", "longitude"]], index=False)
+    return hashlib.sha1(hashed.values.tobytes()).hexdigest()[:16]
+
+def get_station_indices(station_df, grid, latlons=None, cache_dir=None):
+    """
+    Return (iy, ix) arrays for every station in station_df on the given grid.
+
+    Regular projected grids are indexed analytically from the GRIB projection
+    parameters; anything else falls back to a KD-tree over latlons(). Lookups
+    are cached in memory and on disk under cache_dir (config.INDEX_CACHE by
+    default), keyed by grid signature + station signature, so every grid
+    (NDFD, NBM, HRRR, URMA) gets its own map and reruns skip the lookup.
+    Safe to call from multiple threads.
+    """
+    cache_dir = Path(cache_dir or config.INDEX_CACHE)
+    grid_sig = grid_signature(grid)
+    stn_sig = station_signature(station_df)
+    key = (grid_sig, stn_sig)
+
+    with station_index_lock:
+        if key in station_index_cache:
+            return station_index_cache[key]
+
+        cache_file = cache_dir / f"{grid_sig}_{stn_sig}.npz"
+        if cache_file.exists():
+            try:
+                with np.load(cache_file) as cached:
+                    indices = (cached["iy"], cached["ix"])
+                station_index_cache[key] = indices
+                return indices
+            except Exception as e:
+                print(f"⚠️ Ignoring unreadable station index cache {cache_file}: {e}")
+
+        indices = analytic_station_indices(station_df, grid)
+        if indices is None:
+            if latlons is None:
+                raise ValueError(f"Grid {grid.get('gridType')} needs lat/lons for a KD-tree lookup")
+            lats, lons = latlons()
+            indices = stations_to_indices(station_df, lats, lons)
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_dir / f".{grid_sig}_{stn_sig}.{os.getpid()}.npz"
+            np.savez(tmp_file, iy=indices[0], ix=indices[1])
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"⚠️ Could not write station index cache {cache_file}: {e}")
+        station_index_cache[key] = indices
+        return indices
+
+class FieldCache:
+    """
+    Optional on-disk cache of decoded GRIB fields, one entry per (source file, element).
+
+    Each field is stored as a .npy file and read back memory-mapped, so extracting
+    a new station list is a gather instead of a download + decode. The total size
+    is kept under max_bytes by evicting the least recently used entries. Entries
+    are written to a temp dir and renamed into place, so threads and decode
+    worker processes can share one cache.
+
+    Each process keeps a running byte total and only walks the cache directory
+    when that total goes over budget.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.grid_dir = self.cache_dir / "grids"
+        self.grid_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def __getstate__(self):
+        # decode worker processes start with their own lock and running total
+        return dict(self.__dict__, lock=None, total_bytes=None)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def entry_dir(self, source, element):
+        return self.cache_dir / hashlib.sha1(f"{source}|{element}".encode()).hexdigest()
+
+    def get(self, source, element):
+        """Return (fields, valid_times, steps, grid) for a cached file, or None."""
+        entry = self.entry_dir(source, element)
+        meta_file = entry / "meta.json"
+        if not meta_file.exists():
+            return None
+        try:
+            meta = json.loads(meta_file.read_text())
+            fields = {name: np.load(entry / f"{n}.npy", mmap_mode="r") for n, name in enumerate(meta["names"])}
+            os.utime(meta_file)  # mark as recently used
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Ignoring unreadable field cache entry {entry}: {e}")
+            return None
+        steps = pd.to_timedelta(meta["steps"], unit="s") if meta["steps"] is not None else None
+        return fields, pd.DatetimeIndex(meta["valid_times"]), steps, meta["grid"]
+
+    def put(self, source, element, fields, valid_times, steps, grid):
+        entry = self.entry_dir(source, element)
+        if entry.exists():
+            return
+        tmp = self.cache_dir / f".{entry.name}.{os.getpid()}.{threading.get_ident()}"
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            names = list(fields)
+            for n, name in enumerate(names):
+                # fill masked (bitmapped) points before the cast, which would drop the mask
+                np.save(tmp / f"{n}.npy", np.ma.filled(np.ma.asarray(fields[name], dtype=np.float32), np.nan))
+            meta = {
+                "source": source,
+                "element": element,
+                "names": names,
+                "valid_times": [str(t) for t in valid_times],
+                "steps": [float(t.total_seconds()) for t in steps] if steps is not None else None,
+                "grid": grid,
+            }
+            (tmp / "meta.json").write_text(json.dumps(meta, default=lambda o: o.item() if hasattr(o, "item") else str(o)))
+            nbytes = sum(f.stat().st_size for f in tmp.iterdir())
+            os.rename(tmp, entry)
+        except OSError:
+            # another worker cached it first (or the disk is full); either way drop ours
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.added(nbytes)
+
+    def added(self, nbytes):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = self.evict()
+            else:
+                self.total_bytes += nbytes
+            if self.total_bytes > self.max_bytes:
+                # evict down to 90% so a full cache isn't walked again on the very next put
+                self.total_bytes = self.evict(int(self.max_bytes * 0.9))
+
+    def put_grid(self, grid, latlons):
+        """Keep lat/lons for grids that can't be indexed analytically so cached fields can be re-indexed."""
+        if grid is None or grid_is_analytic(grid):
+            return
+        grid_file = self.grid_dir / f"{grid_signature(grid)}.npz"
+        if grid_file.exists():
+            return
+        lats, lons = latlons()
+        tmp_file = self.grid_dir / f".{grid_file.stem}.{os.getpid()}.{threading.get_ident()}.npz"
+        np.savez(tmp_file, lats=lats, lons=lons)
+        os.replace(tmp_file, grid_file)
+
+    def grid_latlons(self, grid):
+        """Callable returning the stored lat/lons for a grid (None if not stored)."""
+        grid_file = self.grid_dir / f"{grid_signature(grid)}.npz"
+        if not grid_file.exists():
+            return None
+        def latlons():
+            with np.load(grid_file) as g:
+                return g["lats"], g["lons"]
+        return latlons
+
+    def evict(self, target_bytes=None):
+        """Delete least recently used entries until the cache fits in target_bytes (max_bytes); returns the new total."""
+        target_bytes = self.max_bytes if target_bytes is None else target_bytes
+        entries = []
+        for entry in self.cache_dir.iterdir():
+            meta_file = entry / "meta.json"
+            if entry.name.startswith(".") or not meta_file.exists():
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((meta_file.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= target_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        return total
+
+class ArchiveManifest:
+    """
+    SQLite manifest of archiving progress, so an interrupted run can resume.
+
+    A job is one output file (the monthly parquet path). Sources are processed in
+    batches; each batch's rows are written to a checkpoint parquet part and the
+    sources are recorded (size, etag, part rows, part checksum) in the same
+    transaction. Parts are marked written once they reach the job's output, so a
+    rerun only appends rows it hasn't written yet. Once the job's period is over and
+    every source succeeded, it is marked finalized and its parts are removed.
+    """
+    def __init__(self, db_path, parts_dir):
+        self.db_path = str(db_path)
+        self.parts_dir = Path(parts_dir)
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as con:
+            con.execute("""CREATE TABLE IF NOT EXISTS files (
+                job TEXT, source TEXT, size INTEGER, etag TEXT, rows INTEGER,
+                checksum TEXT, part TEXT, completed_at TEXT, PRIMARY KEY (job, source))""")
+            con.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job TEXT PRIMARY KEY, rows INTEGER, finalized_at TEXT)""")
+            con.execute("""CREATE TABLE IF NOT EXISTS written (
+                job TEXT, part TEXT, written_at TEXT, PRIMARY KEY (job, part))""")
+            con.execute("""CREATE TABLE IF NOT EXISTS extracted (
+                dataset TEXT, source TEXT, job TEXT, PRIMARY KEY (dataset, source))""")
+            con.execute("""CREATE TABLE IF NOT EXISTS watermarks (
+                name TEXT PRIMARY KEY, value TEXT, updated_at TEXT)""")
+            con.execute("""CREATE TABLE IF NOT EXISTS attempts (
+                dataset TEXT, source TEXT, failures INTEGER, last_failed_at TEXT, PRIMARY KEY (dataset, source))""")
+
+    @contextlib.contextmanager
+    def connect(self):
+        """Connection that commits on success, rolls back on error and is always closed."""
+        with contextlib.closing(sqlite3.connect(self.db_path, timeout=60)) as con:
+            with con:
+                yield con
+
+    def job_dir(self, job):
+        return self.parts_dir / hashlib.sha1(job.encode()).hexdigest()
+
+    def completed_sources(self, job):
+        with self.connect() as con:
+            return {row[0] for row in con.execute("SELECT source FROM files WHERE job = ?", (job,))}
+
+    def is_finalized(self, job):
+        with self.connect() as con:
+            return con.execute("SELECT 1 FROM jobs WHERE job = ? AND finalized_at IS NOT NULL", (job,)).fetchone() is not None
+
+    def commit_batch(self, job, df, sources, sizes=None, etags=None):
+        """Write df as a checkpoint part for job and record sources as done."""
+        part = None
+        checksum = None
+        if not df.empty:
+            job_dir = self.job_dir(job)
+            job_dir.mkdir(parents=True, exist_ok=True)
+            part = job_dir / f"part-{datetime.now(timezone.utc):%Y%m%d%H%M%S%f}.parquet"
+            tmp_part = part.with_suffix(".tmp")
+            df.to_parquet(tmp_part, index=False)
+            checksum = hashlib.sha1(tmp_part.read_bytes()).hexdigest()
+            os.replace(tmp_part, part)
+        sizes = sizes or {}
+        etags = etags or {}
+        now = datetime.now(timezone.utc).isoformat()
+        with self.connect() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(job, source, sizes.get(source), etags.get(source), len(df), checksum,
+                  str(part) if part else None, now) for source in sources])
+
+    def unwritten_parts(self, job):
+        with self.connect() as con:
+            return [row[0] for row in con.execute(
+                """SELECT DISTINCT part FROM files WHERE job = ? AND part IS NOT NULL
+                   AND part NOT IN (SELECT part FROM written WHERE job = ?) ORDER BY part""", (job, job))]
+
+    def load_parts(self, job):
+        """Checkpointed rows for job that haven't been written to its output yet, as one DataFrame."""
+        parts = self.unwritten_parts(job)
+        frames = [pd.read_parquet(part) for part in parts if os.path.exists(part)]
+        if len(frames) < len(parts):
+            print(f"⚠️ {len(parts) - len(frames)} checkpoint parts missing for {job}; use --restart to rebuild it.")
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def extracted_sources(self, dataset):
+        """Sources already extracted into any job of dataset."""
+        with self.connect() as con:
+            return {row[0] for row in con.execute("SELECT source FROM extracted WHERE dataset = ?", (dataset,))}
+
+    def mark_extracted(self, dataset, job, sources):
+        """Record sources appended to job outside of a checkpointed run."""
+        with self.connect() as con:
+            con.executemany("INSERT OR IGNORE INTO extracted VALUES (?, ?, ?)",
+                            [(dataset, source, job) for source in sources])
+
+    def record_failures(self, dataset, sources):
+        """Count one more failed attempt for each source of dataset; returns source -> failures so far."""
+        now = datetime.now(timezone.utc).isoformat()
+        with self.connect() as con:
+            con.executemany("""INSERT INTO attempts VALUES (?, ?, 1, ?) ON CONFLICT (dataset, source)
+                               DO UPDATE SET failures = failures + 1, last_failed_at = excluded.last_failed_at""",
+                            [(dataset, source, now) for source in sources])
+            return {source: con.execute("SELECT failures FROM attempts WHERE dataset = ? AND source = ?",
+                                        (dataset, source)).fetchone()[0] for source in sources}
+
+    def failure_counts(self, dataset):
+        """Failed attempts so far per source of dataset (see record_failures)."""
+        with self.connect() as con:
+            return dict(con.execute("SELECT source, failures FROM attempts WHERE dataset = ?", (dataset,)))
+
+    def watermark(self, name):
+        """Timestamp stored under name, or None if it was never set."""
+        with self.connect() as con:
+            row = con.execute("SELECT value FROM watermarks WHERE name = ?", (name,)).fetchone()
+        return pd.Timestamp(row[0]) if row else None
+
+    def set_watermark(self, name, value):
+        with self.connect() as con:
+            con.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                        (name, pd.Timestamp(value).isoformat(), datetime.now(timezone.utc).isoformat()))
+
+    def mark_written(self, job, parts, dataset=None):
+        """
+        Record checkpoint parts as written to job's output. With a dataset, the sources
+        behind those parts (the ones that produced rows) are also recorded as extracted,
+        so overlapping chunks of the same dataset can skip them.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self.connect() as con:
+            con.executemany("INSERT OR IGNORE INTO written VALUES (?, ?, ?)", [(job, part, now) for part in parts])
+            if dataset is not None:
+                con.executemany("INSERT OR IGNORE INTO extracted SELECT ?, source, job FROM files WHERE job = ? AND part = ?",
+                                [(dataset, job, part) for part in parts])
+
+    def has_output(self, job):
+        """True once rows were written to job's output through the manifest (checkpoint parts or extracted sources)."""
+        with self.connect() as con:
+            return con.execute("SELECT 1 FROM written WHERE job = ? UNION ALL SELECT 1 FROM extracted WHERE job = ? LIMIT 1",
+                               (job, job)).fetchone() is not None
+
+    def finalize(self, job):
+        """Mark job as done for good; later runs skip it until it is reset."""
+        with self.connect() as con:
+            rows = con.execute("SELECT COALESCE(SUM(rows), 0) FROM (SELECT DISTINCT part, rows FROM files WHERE job = ?)",
+                               (job,)).fetchone()[0]
+            con.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?)", (job, rows, datetime.now(timezone.utc).isoformat()))
+        shutil.rmtree(self.job_dir(job), ignore_errors=True)
+
+    def reset(self, job):
+        with self.connect() as con:
+            con.execute("DELETE FROM files WHERE job = ?", (job,))
+            con.execute("DELETE FROM jobs WHERE job = ?", (job,))
+            con.execute("DELETE FROM written WHERE job = ?", (job,))
+            con.execute("DELETE FROM extracted WHERE job = ?", (job,))
+        shutil.rmtree(self.job_dir(job), ignore_errors=True)
+
+class GribCache:
+    """
+    Optional on-disk cache of downloaded GRIB bytes that outlives TMP cleanup.
+
+    Entries are keyed by source URL plus the byte ranges that were selected from
+    it (no ranges for whole files such as NDFD and URMA). Files are written to a
+    temp name and renamed into place so concurrent workers can share the cache,
+    and the total is kept under max_bytes by evicting the least recently used
+    entries.
+    """
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def entry_path(self, url, ranges=None):
+        key = url if not ranges else f"{url}|" + ",".join(format_byte_range(start, end) for start, end in ranges)
+        return self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}.grib2"
+
+    def get_path(self, url, ranges=None):
+        """Path of the cached entry (marked as recently used), or None."""
+        path = self.entry_path(url, ranges)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def get(self, url, ranges=None):
+        path = self.get_path(url, ranges)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url, data, ranges=None):
+        """Store bytes; returns the entry path."""
+        return self.put_stream(url, io.BytesIO(data), ranges)
+
+    def put_stream(self, url, fileobj, ranges=None):
+        """Copy a readable file object into the cache; returns the entry path."""
+        path = self.entry_path(url, ranges)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f_out:
+                shutil.copyfileobj(fileobj, f_out, length=1024 * 1024)
+            os.replace(tmp_path, path)
+        except BaseException:
+            # don't leave a partial download behind in the cache
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self.added(path.stat().st_size)
+        return path
+
+    def put_file(self, url, src_path, ranges=None):
+        with open(src_path, "rb") as f:
+            return self.put_stream(url, f, ranges)
+
+    def link(self, cached_path, local_file):
+        """Expose a cached entry at local_file (hard link, or a copy across filesystems)."""
+        try:
+            os.link(cached_path, local_file)
+        except OSError:
+            shutil.copyfile(cached_path, local_file)
+        return local_file
+
+    def added(self, nbytes):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(f.stat().st_size for f in self.cache_dir.glob("*.grib2"))
+            else:
+                self.total_bytes += nbytes
+            if self.total_bytes > self.max_bytes:
+                self.total_bytes = evict_lru_files(self.cache_dir, self.max_bytes, "*.grib2")
+
 def create_wind_metadata(url, token, state, networks, vars, obrange, precip=0):
     if precip==0:
         params = {
@@ -89,7 +659,7 @@ def create_wind_metadata(url, token, state, networks, vars, obrange, precip=0):
             "state": state,
             "output": "json"
         }
-    response = requests.get(url, params=params)
+    response = http_get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
@@ -104,7 +674,7 @@ def create_precip_metadata(url, token, state, networks, obrange):
         "state": state,
         "output": "json"
     }
-    response = requests.get(url, params=params)
+    response = http_get(url, params=params)
     if response.status_code == 200:
         return response.json()
     else:
@@ -124,13 +694,12 @@ def extract_timestamp(filename):
     time_str = os.path.basename(filename).split("_")[-1]
     return datetime.strptime(time_str, "%Y%m%d%H%M")
 
-def get_ndfd_file_list(start, end, element_dict, element_type):
-    start = pd.to_datetime(start, format="%Y%m%d%H%M") - pd.Timedelta(days=3)
+def get_ndfd_file_list(start, end, element_dict, element_type, lookback_days=3):
+    start = pd.to_datetime(start, format="%Y%m%d%H%M") - pd.Timedelta(days=lookback_days)
     end = pd.to_datetime(end, format="%Y%m%d%H%M")
     date_range = pd.date_range(start=start, end=end, freq="D")
 
     base_s3 = config.NDFD_S3_BASE
-    fs = fsspec.filesystem("s3", anon=True)
     if element_type == "Wind":
         filtered_files = {"wspd": [], "wdir": []}
         components = ["wspd", "wdir"]
@@ -150,121 +719,361 @@ def get_ndfd_file_list(start, end, element_dict, element_type):
         filtered_files = {"snow": []}
         components = ["snow"]
 
+    # one listing per component/day directory, shared by every WMO prefix;
+    # days older than LISTING_CACHE_DAYS are served from the listing cache
+    bucket, root = base_s3.replace("s3://", "").split("/", 1)
+    day_dirs = {f"{root}/{component}/{tdate:%Y}/{tdate:%m}/{tdate:%d}": tdate
+                for component in components for tdate in date_range}
+    listings = list_bucket_prefixes(bucket, day_dirs, max_workers=config.PROBE_WORKERS)
+
     for component in components:
         prefixes = element_dict[element_type][component]
-        for tdate in date_range:
-            for prefix in prefixes:
-                pattern = f"{base_s3}/{component}/{tdate:%Y}/{tdate:%m}/{tdate:%d}/{prefix}_*"
-                try:
-                    matched_files = fs.glob(pattern)
-                    for file in matched_files:
-                        filename = os.path.basename(file)
-                        try:
-                            ftime = datetime.strptime(filename.split("_")[-1], "%Y%m%d%H%M")
-                            if ftime.hour in [11, 23]:
-                                filtered_files[component].append(file)
-                        except ValueError:
-                            continue
-                except Exception as e:
-                    print(f"⚠️ Could not fetch files for {pattern}: {e}")
+        rows = []
+        for day_dir, tdate in day_dirs.items():
+            if not day_dir.startswith(f"{root}/{component}/"):
+                continue
+            listing = listings[day_dir]
+            if listing is None:
+                print(f"⚠️ Could not fetch files for s3://{bucket}/{day_dir}")
+                continue
+            rows.extend((tdate, day_dir, name) for name in listing)
+        if not rows:
+            continue
+
+        files = pd.DataFrame(rows, columns=["day", "dir", "name"])
+        files = files[files["name"].str.startswith(tuple(f"{prefix}_" for prefix in prefixes))]
+        files = files.assign(prefix=files["name"].str.split("_").str[0])
+        ftime = pd.to_datetime(files["name"].str.split("_").str[-1], format="%Y%m%d%H%M", errors="coerce")
+        files = files[ftime.dt.hour.isin([11, 23])]
+        # same order as before: day, then prefix in config order, then file name
+        files = files.assign(rank=files["prefix"].map({p: i for i, p in enumerate(prefixes)}))
+        files = files.sort_values(["day", "rank", "name"])
+        filtered_files[component] = (bucket + "/" + files["dir"] + "/" + files["name"]).tolist()
 
     return filtered_files
 
-def process_file_pair(speed_file, dir_file, station_df, tmp_dir, element_keys):
-    records = []
+def gather_station_values(field, iy_arr, ix_arr):
+    """
+    Gather a (step, y, x) or (y, x) field at all station points in one indexed read.
+    Returns a float64 array shaped (station, step).
+    """
+    if field.ndim == 2:
+        field = field[np.newaxis]
+    values = field[:, iy_arr, ix_arr].T.astype(np.float64)
+    # pygrib returns masked arrays for bitmapped fields
+    return np.ma.filled(values, np.nan)
+
+def ndfd_station_columns(stids, steps, valid_times, spd_values, dir_values=None, spd_key=None, element=None):
+    """
+    Build the NDFD output columns (station-major, step-minor) from (station, step) arrays,
+    applying the unit conversion for element (config.ELEMENT by default) to the whole array at once.
+    """
+    element = element or config.ELEMENT
+    n_step = min(len(steps), spd_values.shape[1])
+    if dir_values is not None:
+        n_step = min(n_step, dir_values.shape[1])
+        dir_values = dir_values[:, :n_step]
+    spd_values = spd_values[:, :n_step]
+    n_stn = len(stids)
+
+    columns = {
+        "station_id": np.repeat(stids, n_step),
+        "valid_time": np.tile(valid_times[:n_step].to_numpy().astype("datetime64[ns]"), n_stn),
+        "forecast_hour": np.tile((steps[:n_step].total_seconds().to_numpy() / 3600).astype(int), n_stn),
+    }
+    if element in NDFD_CONVERSIONS:
+        out_col, convert, decimals = NDFD_CONVERSIONS[element]
+        columns[out_col] = np.round(convert(spd_values), decimals).ravel()
+    else:
+        columns[spd_key] = spd_values.ravel()
+    if element == "Wind" and dir_values is not None:
+        columns["wind_dir_deg"] = np.round(dir_values, 0).ravel()
+    return columns
+
+def cached_ndfd_field(s3_file, key, field_cache, element=None):
+    """(array, valid_times, steps, grid, latlons) from the field cache, or None."""
+    if field_cache is None:
+        return None
+    entry = field_cache.get(s3_file, element or config.ELEMENT)
+    if entry is None or key not in entry[0]:
+        return None
+    fields, valid_times, steps, grid = entry
+    return fields[key], valid_times, steps, grid, field_cache.grid_latlons(grid)
+
+def decode_ndfd_file(local_file, key, s3_file=None, field_cache=None, element=None):
+    """
+    Decode one local NDFD file with the configured reader (and store it in the field cache).
+    Returns (array, valid_times, steps, grid, latlons).
+    """
+    element = element or config.ELEMENT
+    grid, latlons = read_grid_definition_from_file(local_file)
+    if config.GRIB_READERS.get("ndfd", "cfgrib") == "pygrib":
+        fields, valid_times, steps = read_grib_fields(local_file, [key])
+        array = fields[key]
+    else:
+        ds = xr.open_dataset(local_file, engine='cfgrib', backend_kwargs={'indexpath': ''}, decode_timedelta=True)
+        steps = pd.to_timedelta(np.atleast_1d(ds.step.values))
+        valid_times = pd.to_datetime(np.atleast_1d(ds.valid_time.values))
+        array = ds[key].values
+    if field_cache is not None and s3_file is not None:
+        field_cache.put_grid(grid, latlons)
+        field_cache.put(s3_file, element, {key: array}, valid_times, steps, grid)
+    return array, valid_times, steps, grid, latlons
+
+def load_ndfd_field(s3_file, key, tmp_dir, field_cache=None, grib_cache=None):
+    """
+    Fetch and decode one NDFD file (or read it back from the field cache).
+    With a GribCache the file is kept there instead of the per-chunk simplecache in tmp_dir.
+    Returns (array, valid_times, steps, grid, latlons).
+    """
+    cached = cached_ndfd_field(s3_file, key, field_cache)
+    if cached is not None:
+        return cached
+
+    if grib_cache is not None:
+        local_file = grib_cache.get_path(s3_file)
+        if local_file is None:
+            with s3_request_stats() as stats, fsspec.open(f's3://{s3_file}', 'rb', anon=True) as f:
+                local_file = grib_cache.put_stream(s3_file, f)
+                stats["bytes"] = Path(local_file).stat().st_size
+        return decode_ndfd_file(str(local_file), key, s3_file, field_cache)
+
+    url = f'simplecache::s3://{s3_file}'
+    with s3_request_stats() as stats, fsspec.open(url, s3={"anon": True}, filecache={"cache_storage": tmp_dir}) as f:
+        stats["bytes"] = os.path.getsize(f.name)
+        return decode_ndfd_file(f.name, key, s3_file, field_cache)
+
+def download_ndfd_file(s3_file, tmp_dir, grib_cache=None):
+    """
+    Copy one NDFD object to a uniquely named file in tmp_dir (hard-linked from the
+    GRIB cache when enabled) for a decode worker. Returns the local path.
+    """
+    fd, local_file = tempfile.mkstemp(dir=tmp_dir, prefix=f"{os.path.basename(s3_file)}_")
+    os.close(fd)
+    os.remove(local_file)
+    if grib_cache is not None:
+        cached = grib_cache.get_path(s3_file)
+        if cached is None:
+            with s3_request_stats() as stats, fsspec.open(f's3://{s3_file}', 'rb', anon=True) as f:
+                cached = grib_cache.put_stream(s3_file, f)
+                stats["bytes"] = Path(cached).stat().st_size
+        return grib_cache.link(cached, local_file)
+    with s3_request_stats() as stats:
+        fsspec.filesystem("s3", anon=True).get_file(s3_file, local_file)
+        stats["bytes"] = os.path.getsize(local_file)
+    return local_file
+
+def decode_ndfd_pair(task):
+    """
+    Decode one NDFD speed (+ direction) file pair; runs in a decode worker process.
+    Station indices come with the task, computed once in the parent for the grid
+    of the first file; a file on any other grid looks its own indices up.
+    Returns (source, columns, error) with columns as numpy arrays; source names the
+    S3 file(s) of the pair, since field-cache hits have no local file.
+    """
+    source = f"{task['source']} + {task['dir_source']}" if task["dir_source"] else task["source"]
     try:
-        speed_url = f'simplecache::s3://{speed_file}'
-        dir_url = f'simplecache::s3://{dir_file}' if dir_file else None
-
-        with fsspec.open(speed_url, s3={"anon": True}, filecache={"cache_storage": tmp_dir}) as f_speed:
-            ds_speed = xr.open_dataset(f_speed.name, engine='cfgrib', backend_kwargs={'indexpath': ''}, decode_timedelta=True)
-        #print(f"Our dataset is: {ds_speed}")
-        ds_dir = None
-        if dir_url:
-            with fsspec.open(dir_url, s3={"anon": True}, filecache={"cache_storage": tmp_dir}) as f_dir:
-                ds_dir = xr.open_dataset(f_dir.name, engine='cfgrib', backend_kwargs={'indexpath': ''}, decode_timedelta=True)
-
-        lats = ds_speed.latitude.values
-        lons = ds_speed.longitude.values - 360
-        steps = pd.to_timedelta(ds_speed.step.values)
-        valid_times = pd.to_datetime(ds_speed.valid_time.values)
+        element = task["element"]
+        field_cache = task["field_cache"]
+        spd = cached_ndfd_field(task["source"], task["spd_key"], field_cache, element)
+        if spd is None:
+            spd = decode_ndfd_file(task["local_file"], task["spd_key"], task["source"], field_cache, element)
+        speed_array, valid_times, steps, grid, latlons = spd
+
+        dir_array = None
+        if task["dir_source"] and task["dir_key"]:
+            drc = cached_ndfd_field(task["dir_source"], task["dir_key"], field_cache, element)
+            if drc is None:
+                drc = decode_ndfd_file(task["dir_file"], task["dir_key"], task["dir_source"], field_cache, element)
+            dir_array = drc[0]
+
+        if grid_signature(grid) == task["grid_sig"]:
+            iy_arr, ix_arr = task["iy"], task["ix"]
+        else:
+            iy_arr, ix_arr = get_station_indices(task["station_df"], grid, latlons)
 
-        spd_key = element_keys[0]
-        speed_array = ds_speed[spd_key].values
-        dir_array = ds_dir[element_keys[1]].values if ds_dir and len(element_keys) > 1 else None
+        columns = ndfd_station_columns(
+            task["station_df"]["stid"].to_numpy(), steps, valid_times,
+            gather_station_values(speed_array, iy_arr, ix_arr),
+            gather_station_values(dir_array, iy_arr, ix_arr) if dir_array is not None else None,
+            task["spd_key"], element,
+        )
+        return source, columns, None
+    except Exception as e:
+        return source, None, str(e)
 
-        for _, row in station_df.iterrows():
-            stid = row["stid"]
-            lat = row["latitude"]
-            lon = row["longitude"]
+def extract_ndfd_pairs_in_processes(matched_pairs, station_df, tmp_dir, element_keys, field_cache=None,
+                                    grib_cache=None, controller=None):
+    """
+    Process-pool variant of the NDFD extraction: pairs are downloaded by threads
+    and decoded by config.DECODE_WORKERS processes as each download lands.
+    Returns (df, speed files of the pairs that failed).
+    """
+    spd_key = element_keys[0]
+    dir_key = element_keys[1] if len(element_keys) > 1 else None
+    station_df = station_df[["stid", "latitude", "longitude"]]
+    grid_index = {}
+
+    def fetch_pair(pair):
+        local_files = []
+        for s3_file, key in zip(pair, (spd_key, dir_key)):
+            if s3_file is None or key is None or cached_ndfd_field(s3_file, key, field_cache) is not None:
+                local_files.append(None)
+                continue
+            local_files.append(download_ndfd_file(s3_file, tmp_dir, grib_cache))
+        return pair, tuple(local_files)
 
-            if stid in station_index_cache:
-                iy, ix = station_index_cache[stid]
+    def download_pair(pair):
+        try:
+            if controller is not None:
+                return controller.run(fetch_pair, pair)
+            return fetch_pair(pair)
+        except Exception as e:
+            print(f"❌ Failed to download {pair[0]} + {pair[1]}: {e}")
+            return pair, None
+
+    def make_task(pair, local_files):
+        # the station index is worked out once, from the first file's grid, and shipped with every task
+        if not grid_index:
+            spd_local = local_files[0]
+            if spd_local is not None:
+                grid, latlons = read_grid_definition_from_file(spd_local)
             else:
-                iy, ix = ll_to_index(lat, lon, lats, lons)
-                station_index_cache[stid] = (iy, ix)
-
-            spd_values = speed_array[:, iy, ix]
-            dir_values = dir_array[:, iy, ix] if dir_array is not None else [None] * len(spd_values)
-
-            for step, valid_time, spd, direc in zip(steps, valid_times, spd_values, dir_values):
-                step_hr = int(step.total_seconds() / 3600)
-                record = {
-                    "station_id": stid,
-                    "valid_time": valid_time,
-                    "forecast_hour": step_hr,
-                }
-                if config.ELEMENT == "Wind":
-                    record["wind_speed_kt"] = round(float(MS_to_KTS(spd)), 2)
-                    if direc is not None:
-                        record["wind_dir_deg"] = round(float(direc), 0)
-                elif config.ELEMENT == "Gust":
-                    record["wind_gust_kt"] = round(float(MS_to_KTS(spd)), 2)
-                elif config.ELEMENT == "precip6hr":
-                    record["precip6hr"] = round(float(MM_to_IN(spd)), 2)
-                elif config.ELEMENT == "maxt":
-                    record["maxt"] = round(float(K_to_F(spd)), 2)
-                elif config.ELEMENT == "mint":
-                    record["mint"] = round(float(K_to_F(spd)), 2)
-                elif config.ELEMENT == "snow6hr":
-                    record["snow6hr"] = round(float(M_to_IN(spd)), 1)
-                else:
-                    record[spd_key] = float(spd)
+                _, _, _, grid, latlons = cached_ndfd_field(pair[0], spd_key, field_cache)
+            grid_index["grid_sig"] = grid_signature(grid)
+            grid_index["iy"], grid_index["ix"] = get_station_indices(station_df, grid, latlons)
+        return {
+            "local_file": local_files[0], "dir_file": local_files[1],
+            "source": pair[0], "dir_source": pair[1] if dir_key else None,
+            "spd_key": spd_key, "dir_key": dir_key, "element": config.ELEMENT,
+            "station_df": station_df, "field_cache": field_cache, **grid_index,
+        }
 
-                records.append(record)
+    results = stream_download_decode(
+        matched_pairs, download_pair, make_task,
+        download_workers=controller.max_limit if controller is not None else config.MAX_WORKERS,
+        decode_workers=config.DECODE_WORKERS,
+        max_files_on_disk=config.MAX_FILES_ON_DISK,
+        decode_fn=decode_ndfd_pair,
+    )
+    all_columns, failed = [], []
+    for pair, result in zip(matched_pairs, results):
+        if result is None:
+            failed.append(pair[0])
+            continue
+        source, columns, error = result
+        if error:
+            print(f"❌ Failed to process {source}: {error}")
+            failed.append(pair[0])
+        elif columns:
+            all_columns.append(columns)
+    return columns_to_dataframe(all_columns), failed
+
+def process_file_pair(speed_file, dir_file, station_df, tmp_dir, element_keys, field_cache=None, grib_cache=None):
+    columns = {}
+    try:
+        spd_key = element_keys[0]
+        dir_key = element_keys[1] if len(element_keys) > 1 else None
+
+        speed_array, valid_times, steps, grid, latlons = load_ndfd_field(speed_file, spd_key, tmp_dir, field_cache, grib_cache)
+        dir_array = None
+        if dir_file and dir_key:
+            dir_array = load_ndfd_field(dir_file, dir_key, tmp_dir, field_cache, grib_cache)[0]
+
+        iy_arr, ix_arr = get_station_indices(station_df, grid, latlons)
+        columns = ndfd_station_columns(
+            station_df["stid"].to_numpy(), steps, valid_times,
+            gather_station_values(speed_array, iy_arr, ix_arr),
+            gather_station_values(dir_array, iy_arr, ix_arr) if dir_array is not None else None,
+            spd_key,
+        )
 
     except Exception as e:
         print(f"❌ Failed to process {speed_file} + {dir_file}: {e}")
-    return pd.DataFrame.from_records(records)
-
-def extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tmp_dir):
+    return pd.DataFrame(columns)
+
+def ndfd_file_table(files):
+    """file, issuance time and WMO stream (the ii of e.g. YCRZ98 -> "98") for NDFD object paths."""
+    names = pd.Series(list(files), dtype=object)
+    base = names.str.rsplit("/", n=1).str[-1]
+    return pd.DataFrame({
+        "file": names,
+        "time": pd.to_datetime(base.str.split("_").str[-1], format="%Y%m%d%H%M", errors="coerce"),
+        "stream": base.str.split("_").str[0].str[4:],
+    })
+
+def pair_ndfd_files(speed_files, direction_files=None, tolerance=pd.Timedelta("2 minutes")):
+    """
+    Pair each speed file with the direction file nearest in issuance time (within
+    tolerance) from the same WMO stream, so YCRZ98 pairs with YBRZ98 and YCRZ97 with
+    YBRZ97. Uses one sorted merge_asof instead of comparing every pair.
+    Returns [(speed_file, direction_file or None)] sorted by issuance time.
+    """
+    speed = ndfd_file_table(speed_files)
+    bad = speed["time"].isna()
+    if bad.any():
+        print(f"⚠️ Skipping {bad.sum()} files without an issuance time: {speed.loc[bad, 'file'].tolist()[:5]}")
+    speed = speed[~bad].sort_values("time", kind="stable")
+    if direction_files is None:
+        return [(f, None) for f in speed["file"]]
+
+    direction = ndfd_file_table(direction_files).dropna(subset=["time"])
+    direction = direction.rename(columns={"file": "dir_file", "time": "dir_time"}).sort_values("dir_time", kind="stable")
+    merged = pd.merge_asof(speed, direction, left_on="time", right_on="dir_time", by="stream",
+                           direction="nearest", tolerance=tolerance)
+
+    unmatched_speed = merged.loc[merged["dir_file"].isna(), "file"]
+    unmatched_dir = direction.loc[~direction["dir_file"].isin(merged["dir_file"]), "dir_file"]
+    if len(unmatched_speed) or len(unmatched_dir):
+        print(f"⚠️ {len(unmatched_speed)} speed files without a direction file within {tolerance}, "
+              f"{len(unmatched_dir)} direction files unused.")
+        for label, files in (("speed", unmatched_speed), ("direction", unmatched_dir)):
+            if len(files):
+                print(f"   unmatched {label}: {', '.join(os.path.basename(f) for f in files.tolist()[:10])}"
+                      f"{' ...' if len(files) > 10 else ''}")
+
+    return [(f, d if isinstance(d, str) else None) for f, d in zip(merged["file"], merged["dir_file"])]
+
+def extract_ndfd_forecasts_parallel(speed_files, direction_files, station_df, tmp_dir, field_cache=None, grib_cache=None,
+                                    return_failed=False):
+    """
+    Pair and extract NDFD speed (+ direction) files at the stations. With return_failed,
+    returns (df, speed files whose pair failed to download or decode) instead of just df.
+    """
     print(f"TMP dir is: {tmp_dir}")
     element_keys = config.NDFD_ELEMENT_STRINGS[config.ELEMENT]
-    speed_with_time = sorted([(f, extract_timestamp(f)) for f in speed_files], key=lambda x: x[1])
-    dir_with_time = sorted([(f, extract_timestamp(f)) for f in direction_files], key=lambda x: x[1])
-    matched_pairs = []
-
-    for speed_file, speed_time in speed_with_time:
-        if len(element_keys) > 1:
-            closest_match = None
-            min_diff = pd.Timedelta("2 minutes")
-            for dir_file, dir_time in dir_with_time:
-                diff = abs(dir_time - speed_time)
-                if diff <= min_diff:
-                    closest_match = dir_file
-                    min_diff = diff
-            matched_pairs.append((speed_file, closest_match))
-        else:
-            matched_pairs.append((speed_file, None))
-
-    results = []
-    with ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
-        futures = [executor.submit(process_file_pair, s, d, station_df, tmp_dir, element_keys) for s, d in matched_pairs]
+    matched_pairs = pair_ndfd_files(speed_files, direction_files if len(element_keys) > 1 else None)
+
+    controller = make_concurrency_controller()
+    if config.NDFD_PROCESS_DECODE and config.DECODE_WORKERS > 1:
+        print(f"🧮 Decoding {len(matched_pairs)} file pairs in {config.DECODE_WORKERS} processes...")
+        df, failed = extract_ndfd_pairs_in_processes(matched_pairs, station_df, tmp_dir, element_keys,
+                                                     field_cache, grib_cache, controller)
+        if controller is not None:
+            print(f"⚙️ Adaptive concurrency: {controller.stats()}")
+        return (df, failed) if return_failed else df
+
+    workers = config.MAX_WORKERS
+    run_pair = process_file_pair
+    if controller is not None:
+        workers = controller.max_limit
+        run_pair = lambda *args: controller.run(process_file_pair, *args, succeeded=lambda df: not df.empty)
+
+    results, failed = [], []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_pair, s, d, station_df, tmp_dir, element_keys, field_cache, grib_cache): s for s, d in matched_pairs}
         for i, future in enumerate(as_completed(futures), 1):
-            results.append(future.result())
+            df = future.result()
+            # process_file_pair returns an empty frame when the pair failed
+            if df.empty:
+                failed.append(futures[future])
+            results.append(df)
             print(f"✅ Completed {i}/{len(matched_pairs)} file pairs.")
-    
-    return pd.concat(results, ignore_index=True)
+    if controller is not None:
+        print(f"⚙️ Adaptive concurrency: {controller.stats()}")
+
+    df = pd.concat(results, ignore_index=True) if results else pd.DataFrame()
+    return (df, failed) if return_failed else df
 
 def generate_model_date_range(model, config):
     cycle = config.HERBIE_CYCLES[model]
@@ -314,12 +1123,15 @@ def labels_for_24h_accum(fcst_hour: int):
     return alts
 
 
-def get_model_file_list(start, end, fcst_hours, cycle, base_url, element, model="nbm", domain="ak"):
+def get_model_file_list(start, end, fcst_hours, cycle, base_url, element, model="nbm", domain="ak", return_sizes=False):
     """
-    Generate available NBM HTTPS URLs by checking if the index file (.idx) exists.
+    Generate available NBM HTTPS URLs by checking if the index file (.idx) exists,
+    either from a bucket listing per directory (config.FILE_LIST_METHOD = "listing")
+    or a HEAD request per file ("head").
 
     Returns:
     - list[str] — HTTPS URLs to GRIB2 files
+    - with return_sizes, also dict[str, int] — object size per URL (listing mode only)
     """
     if domain == "ak":
         full_domain = "alaska"
@@ -346,7 +1158,7 @@ def get_model_file_list(start, end, fcst_hours, cycle, base_url, element, model=
         print(f"url formatting for {base_url} for {model} not implemented. Check file name on AWS such as 'blend.t12z.f024.ak.grib2'.")
         raise NotImplementedError
         sys.exit()
-    file_urls = []
+    candidates = []
     for init in init_times:
         init_date = init.strftime("%Y%m%d")
         init_hour = init.strftime("%H")
@@ -354,14 +1166,7 @@ def get_model_file_list(start, end, fcst_hours, cycle, base_url, element, model=
         if model == 'urma':
             relative_path = f"{designator}.{init_date}/{designator}.t{int(init_hour):02d}z.2dvaranl_ndfd_3p0.grb2"
             full_url = f"{base_url}/{relative_path}"
-            try:
-                r = requests.head(full_url, timeout=5)
-                if r.ok:
-                    file_urls.append(full_url)
-                else:
-                    print(f"⚠️ Missing: {full_url} — {r.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"⚠️ Error accessing {idx_url}: {e}")
+            candidates.append((full_url, full_url + ".idx", init))
         else:
             for fh in fcst_hours:
                 if model == 'nbm':
@@ -377,41 +1182,367 @@ def get_model_file_list(start, end, fcst_hours, cycle, base_url, element, model=
                     fxx = f"f{fh:02d}"
                     relative_path = f"{designator}.{init_date}/{full_domain}/{designator}.t{init_hour}z.wrf{config.HERBIE_PRODUCTS[config.MODEL]}{fxx}.{domain}.grib2"
                 full_url = f"{base_url}/{relative_path}"
-                idx_url = full_url + ".idx"
+                candidates.append((full_url, full_url + ".idx", init))
 
-                try:
-                    r = requests.head(idx_url, timeout=5)
-                    if r.ok:
-                        file_urls.append(full_url)
-                    else:
-                        print(f"⚠️ Missing: {idx_url} — {r.status_code}")
-                except requests.exceptions.RequestException as e:
-                    print(f"⚠️ Error accessing {idx_url}: {e}")
+    # an .idx already in the local idx cache proves the file exists
+    cached = {probe_url for _, probe_url, _ in candidates
+              if probe_url.endswith(".idx") and idx_cache_path(probe_url).exists()}
+    unchecked = [c for c in candidates if c[1] not in cached]
+    if cached:
+        print(f"💾 {len(cached)} files already known from the idx cache.")
+
+    file_urls = []
+    file_sizes = {}
+    missing = []
+    errored = []
+    if config.FILE_LIST_METHOD == "listing":
+        # one bucket listing per directory instead of one HEAD per file
+        bucket = base_url.split("//")[-1].split(".")[0]
+        prefixes = {}
+        for full_url, probe_url, init in unchecked:
+            prefixes[os.path.dirname(probe_url[len(base_url) + 1:])] = init
+        print(f"🔎 Listing {len(prefixes)} prefixes in {bucket} for {len(unchecked)} files...")
+        listings = list_bucket_prefixes(bucket, prefixes, max_workers=config.PROBE_WORKERS)
+        for full_url, probe_url, init in candidates:
+            listing = listings.get(os.path.dirname(probe_url[len(base_url) + 1:]))
+            if probe_url in cached:
+                file_urls.append(full_url)
+                if listing:
+                    file_sizes[full_url] = listing.get(os.path.basename(full_url))
+            elif listing is None:
+                errored.append((probe_url, "prefix listing failed"))
+            elif os.path.basename(probe_url) in listing:
+                file_urls.append(full_url)
+                file_sizes[full_url] = listing.get(os.path.basename(full_url))
+            else:
+                missing.append((probe_url, "not in bucket listing"))
+    else:
+        print(f"🔎 Checking {len(unchecked)} files ({config.PROBE_WORKERS} at a time)...")
+        probes = dict(zip([probe_url for _, probe_url, _ in unchecked],
+                          probe_urls([probe_url for _, probe_url, _ in unchecked], max_workers=config.PROBE_WORKERS)))
+        for full_url, probe_url, init in candidates:
+            ok, status = probes.get(probe_url, (True, None))
+            if ok:
+                file_urls.append(full_url)
+            elif isinstance(status, int):
+                missing.append((probe_url, status))
+            else:
+                errored.append((probe_url, status))
+
+    for probe_url, status in missing:
+        print(f"⚠️ Missing: {probe_url} — {status}")
+    for probe_url, error in errored:
+        print(f"⚠️ Error accessing {probe_url}: {error}")
+    print(f"📋 {len(file_urls)} available, {len(missing)} missing, {len(errored)} errored.")
     #print(f"File urls are: {file_urls}")
+    if return_sizes:
+        return file_urls, file_sizes
     return file_urls
 
+def list_bucket_prefixes(bucket, prefixes, max_workers=16, cache_dir=None, cache_after_days=None):
+    """
+    List each prefix (directory) of a public S3 bucket once, concurrently.
+
+    prefixes: dict of prefix -> timestamp of the data under it. Listings for
+    prefixes older than cache_after_days are closed and get persisted as JSON
+    under cache_dir (config.LISTING_CACHE), so a backfill never re-lists them.
+
+    Returns dict of prefix -> {filename: size in bytes}, or None for a failed listing.
+    """
+    cache_dir = Path(cache_dir or config.LISTING_CACHE)
+    cache_after_days = config.LISTING_CACHE_DAYS if cache_after_days is None else cache_after_days
+    cutoff = pd.Timestamp.now("UTC").tz_localize(None) - pd.Timedelta(days=cache_after_days)
+    fs = fsspec.filesystem("s3", anon=True)
+
+    def list_prefix(prefix):
+        cache_file = cache_dir / f"{hashlib.sha1(f'{bucket}/{prefix}'.encode()).hexdigest()}.json"
+        if cache_file.exists():
+            try:
+                return prefix, json.loads(cache_file.read_text())
+            except ValueError:
+                pass
+        try:
+            entries = fs.ls(f"{bucket}/{prefix}", detail=True, refresh=True)
+            listing = {os.path.basename(e["name"]): e.get("size") for e in entries if e.get("type") != "directory"}
+        except FileNotFoundError:
+            listing = {}
+        except Exception as e:
+            print(f"⚠️ Could not list s3://{bucket}/{prefix}: {e}")
+            return prefix, None
+        if pd.Timestamp(prefixes[prefix]) < cutoff:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_file.write_text(json.dumps(listing))
+            os.replace(tmp_file, cache_file)
+        return prefix, listing
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(list_prefix, list(prefixes)))
+
+def get_http_session():
+    """
+    Shared requests.Session used for all HTTP in the archivers.
+
+    Connections are kept alive in a pool sized for the busiest thread pool, and
+    requests are retried with exponential backoff on connection errors and on
+    429/5xx replies (S3 answers SlowDown with a 503), honoring Retry-After.
+    requests sessions are safe to share between threads for plain GETs/HEADs.
+    """
+    with http_session_lock:
+        if http_session_state["session"] is None:
+            retry = Retry(
+                total=config.HTTP_RETRIES,
+                backoff_factor=config.HTTP_BACKOFF,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=frozenset(["GET", "HEAD"]),
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            workers = config.ADAPTIVE_MAX_WORKERS if config.ADAPTIVE_CONCURRENCY else config.MAX_WORKERS
+            pool_size = max(workers * config.RANGE_FETCH_WORKERS, config.PROBE_WORKERS)
+            adapter = HTTPAdapter(pool_connections=10, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            http_session_state["session"] = session
+        return http_session_state["session"]
+
+def http_request(method, url, **kwargs):
+    """
+    Send a request through the shared session, with config.HTTP_TIMEOUT unless a
+    timeout is given, and count bytes, throttling (429/503, including ones retried
+    away) and timeouts in http_stats for the adaptive concurrency controller.
+    """
+    kwargs.setdefault("timeout", config.HTTP_TIMEOUT)
+    try:
+        r = get_http_session().request(method, url, **kwargs)
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        with http_stats_lock:
+            http_stats["requests"] += 1
+            http_stats["throttled"] += 1
+        raise
+    retries = getattr(r.raw, "retries", None)
+    history = getattr(retries, "history", None) or ()
+    throttled = r.status_code in (429, 503) or any(h.status in (429, 503) for h in history)
+    with http_stats_lock:
+        http_stats["requests"] += 1
+        http_stats["bytes"] += int(r.headers.get("Content-Length") or 0) if method == "GET" else 0
+        http_stats["throttled"] += int(throttled)
+    return r
+
+def s3_throttled(error):
+    """True if an s3fs/botocore error, or one it was raised from, is S3 throttling (SlowDown/503) or a timeout."""
+    while error is not None:
+        text = f"{type(error).__name__} {error}"
+        if isinstance(error, (TimeoutError, ConnectionError)) or any(
+                marker in text for marker in ("SlowDown", "503", "Throttl", "reduce your request rate", "Timeout")):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+@contextlib.contextmanager
+def s3_request_stats():
+    """
+    Count one S3 fetch made through fsspec/s3fs in http_stats, the way http_request
+    counts HTTP ones, so NDFD SlowDown/503s and timeouts reach the adaptive
+    concurrency controller. The caller sets stats["bytes"] once the object is fetched.
+    """
+    stats = {"bytes": 0}
+    try:
+        yield stats
+    except Exception as e:
+        with http_stats_lock:
+            http_stats["requests"] += 1
+            http_stats["throttled"] += int(s3_throttled(e))
+        raise
+    with http_stats_lock:
+        http_stats["requests"] += 1
+        http_stats["bytes"] += stats["bytes"]
+
+def http_get(url, **kwargs):
+    """GET through the shared session (see http_request)."""
+    return http_request("GET", url, **kwargs)
+
+def http_head(url, **kwargs):
+    """HEAD through the shared session (see http_request)."""
+    return http_request("HEAD", url, **kwargs)
+
+class AdaptiveConcurrency:
+    """
+    Adaptive limit on how many downloads run at once.
+
+    Tasks run through run(), which blocks while limit tasks are in flight. After
+    every window of completed tasks the controller compares throughput (tasks/s)
+    with the previous window: it adds a slot while throughput keeps improving,
+    halves the limit when requests were throttled (429/503 SlowDown), timed out or
+    too many tasks failed, and drops a slot when latency climbs without a gain in
+    throughput. Thread pools are sized to max_limit and gated by this controller.
+    """
+    def __init__(self, initial, min_limit=2, max_limit=64, window=None):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = min(max(initial, min_limit), self.max_limit)
+        self.window = window
+        self.in_flight = 0
+        self.throughput = 0.0
+        self.bytes_per_second = 0.0
+        self.condition = threading.Condition()
+        self.reset_window()
+        self.best_latency = None
+
+    def reset_window(self):
+        self.window_start = time.monotonic()
+        self.window_latencies = []
+        self.window_failures = 0
+        with http_stats_lock:
+            self.window_http = dict(http_stats)
+
+    def run(self, fn, *args, succeeded=None):
+        """Run fn(*args) once a slot is free and feed its latency and outcome to the controller."""
+        with self.condition:
+            while self.in_flight >= self.limit:
+                self.condition.wait()
+            self.in_flight += 1
+        start = time.monotonic()
+        ok = False
+        try:
+            result = fn(*args)
+            ok = succeeded(result) if succeeded else True
+            return result
+        finally:
+            self.task_done(time.monotonic() - start, ok)
+
+    def task_done(self, latency, ok):
+        with self.condition:
+            self.in_flight -= 1
+            self.window_latencies.append(latency)
+            self.window_failures += not ok
+            if len(self.window_latencies) >= (self.window or max(4, self.limit)):
+                self.adjust()
+            self.condition.notify_all()
+
+    def adjust(self):
+        elapsed = max(time.monotonic() - self.window_start, 1e-6)
+        n_tasks = len(self.window_latencies)
+        rate = n_tasks / elapsed
+        latency = float(np.median(self.window_latencies))
+        with http_stats_lock:
+            throttled = http_stats["throttled"] - self.window_http["throttled"]
+            self.bytes_per_second = (http_stats["bytes"] - self.window_http["bytes"]) / elapsed
+
+        if throttled or self.window_failures / n_tasks > config.ADAPTIVE_FAILURE_FRACTION:
+            self.limit = max(self.min_limit, self.limit // 2)
+            self.best_latency = None
+        elif (self.best_latency is not None and latency > config.ADAPTIVE_LATENCY_FACTOR * self.best_latency
+              and rate <= self.throughput):
+            self.limit = max(self.min_limit, self.limit - 1)
+        elif rate > self.throughput * 1.05:
+            self.limit = min(self.max_limit, self.limit + 1)
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+        self.throughput = rate
+        self.reset_window()
+
+    def stats(self):
+        """Current limit, in-flight tasks and last window's throughput."""
+        with self.condition:
+            return {"limit": self.limit, "in_flight": self.in_flight,
+                    "tasks_per_second": round(self.throughput, 2),
+                    "mb_per_second": round(self.bytes_per_second / 1e6, 2)}
+
+def make_concurrency_controller():
+    """AdaptiveConcurrency per the config, or None when ADAPTIVE_CONCURRENCY is off."""
+    if not config.ADAPTIVE_CONCURRENCY:
+        return None
+    return AdaptiveConcurrency(config.MAX_WORKERS, min_limit=config.ADAPTIVE_MIN_WORKERS,
+                               max_limit=config.ADAPTIVE_MAX_WORKERS)
+
+def probe_urls(urls, max_workers=16, timeout=5):
+    """
+    HEAD every url concurrently over the shared session.
+
+    Returns a list aligned with urls of (ok, status): status is the HTTP status
+    code for answered requests, or the error message if the request failed.
+    """
+    def probe(url):
+        try:
+            r = http_head(url, timeout=timeout)
+            return r.ok, r.status_code
+        except requests.exceptions.RequestException as e:
+            return False, str(e)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(probe, urls))
+
+
+def download_whole_file(remote_url, local_filename, chunk_size=1024 * 1024):
+    """
+    Stream a whole remote file to local_filename in chunks, so it is never held in
+    memory. Written under a temp name and renamed when complete.
+    Returns local_filename, or None if the download failed.
+    """
+    tmp_filename = f"{local_filename}.part"
+    try:
+        with http_get(remote_url, stream=True) as r:
+            if r.status_code != 200:
+                print(f"❌ Failed to download {remote_url} ({r.status_code})")
+                return None
+            with open(tmp_filename, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        os.replace(tmp_filename, local_filename)
+        return local_filename
+    except Exception as e:
+        print(f"❌ Exception downloading {remote_url}: {e}")
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        return None
 
 def download_subset(remote_url, local_filename, search_strings, model, element,
                     require_all_matches=True,
                     required_phrases=None,
-                    exclude_phrases=None):
+                    exclude_phrases=None,
+                    grib_cache=None):
+    """
+    Download a subset of a GRIB2 file based on .idx entries matching search_strings
+    and write it to local_filename. See fetch_subset_bytes for the matching logic.
+    Returns local_filename, b"" if the file has nothing to extract, or None on failure.
+    """
+    os.makedirs(os.path.dirname(local_filename), exist_ok=True)
+    subset = fetch_subset_bytes(remote_url, search_strings, model, element,
+                                require_all_matches=require_all_matches,
+                                required_phrases=required_phrases,
+                                exclude_phrases=exclude_phrases,
+                                grib_cache=grib_cache)
+    if not subset:
+        return subset
+
+    with open(local_filename, 'wb') as f_out:
+        f_out.write(subset)
+
+    print(f'      → {local_filename}')
+    return local_filename if os.path.exists(local_filename) else None
+
+def fetch_subset_bytes(remote_url, search_strings, model, element,
+                       require_all_matches=True,
+                       required_phrases=None,
+                       exclude_phrases=None,
+                       grib_cache=None):
     """
-    Download a subset of a GRIB2 file based on .idx entries matching search_strings.
+    Fetch the GRIB2 messages whose .idx entries match search_strings and return
+    them concatenated as bytes. Returns b"" when the file has nothing to extract
+    (no or not all variables matched, no accumulation for its forecast hour), so
+    callers can tell that apart from a failed fetch, which returns None.
+    With a GribCache, a subset already fetched for the same byte ranges is reused.
 
     If model == "nbmqpd", apply special logic to match 24-hr APCP percentiles.
     """
     print(f"  > Downloading subset for {os.path.basename(remote_url)}")
-    os.makedirs(os.path.dirname(local_filename), exist_ok=True)
 
-    # Download .idx file
-    idx_url = remote_url + ".idx"
-    r = requests.get(idx_url)
-    if not r.ok:
-        print(f'     ❌ Could not get index file: {idx_url} ({r.status_code} {r.reason})')
+    inventory = load_idx_inventory(remote_url)
+    if inventory is None:
         return None
-
-    lines = r.text.strip().split('\n')
-    matched_ranges = {}
+    selected = select_idx_messages(inventory, search_strings=search_strings, exclude_phrases=exclude_phrases)
 
     # Special handling for NBM QPF percentiles
     if model == "nbmqmd" or model == 'nbmqmd_exp':
@@ -420,7 +1551,7 @@ def download_subset(remote_url, local_filename, search_strings, model, element,
         fcst_match = re.search(r"f(\d{3})", base)
         if not fcst_match:
             print("     ❌ Could not determine forecast hour from filename.")
-            return None
+            return b""
         fcst_hour = int(fcst_match.group(1))
         tr_end = fcst_hour
         if element == "precip24hr":
@@ -428,161 +1559,351 @@ def download_subset(remote_url, local_filename, search_strings, model, element,
             if not accum_alts:
                 # no 24-h accumulation at t=0
                 print("     ℹ️ No 24-h accumulation at forecast hour 0")
-                return None
-            accum_str = accum_alts[0]
+                return b""
         elif element == 'precip6hr':
             tr_start = fcst_hour - 6
-            accum_str = f"{tr_start}-{tr_end} hour acc fcst"
+            accum_alts = [f"{tr_start}-{tr_end} hour acc fcst"]
         elif element == "maxt":
             tr_start = fcst_hour - 18
-            accum_str = f"{tr_start}-{tr_end} hour max fcst"
+            accum_alts = [f"{tr_start}-{tr_end} hour max fcst"]
         elif element == "mint":
             tr_start = fcst_hour - 18
-            accum_str = f"{tr_start}-{tr_end} hour min fcst"
-        elif element == "Wind":
-            tr_start = tr_end
-            accum_str = f"{tr_end} hour fcst"
-        elif element == "Gust":
-            tr_start = tr_end
-            accum_str = f"{tr_end} hour fcst"
+            accum_alts = [f"{tr_start}-{tr_end} hour min fcst"]
+        elif element in ["Wind", "Gust"]:
+            accum_alts = [f"{tr_end} hour fcst"]
         else:
             raise NotImplementedError(f"Adjust your time step for {element} and {model} in download_subset in utils.py")
         # Target percentiles
-        # With this:
         target_perc_values = {5, 10, 25, 50, 75, 90, 95}
-        # Compile search patterns
-        search_exprs = [re.escape(s) for s in search_strings]
-        search_pattern = re.compile("|".join(search_exprs))
-        for n, line in enumerate(lines, start=1):
-            if exclude_phrases and any(phrase in line for phrase in exclude_phrases):
-                continue
-            if not search_pattern.search(line):
-                continue
-            if accum_str not in line:
-                continue
-            #if not any(level in line for level in target_levels):
-            #    continue
-            last_token = line.split(":")[-1].strip()
-            match = re.match(r"(\d+)% level", last_token)
-            if not match or int(match.group(1)) not in target_perc_values:
-                continue
-            parts = line.split(':')
-            rangestart = int(parts[1])
-
-            if n < len(lines):
-                parts_next = lines[n].split(':')
-                rangeend = int(parts_next[1]) - 1
-            else:
-                rangeend = ''
-
-            byte_range = f'{rangestart}-{rangeend}' if rangeend else f'{rangestart}-'
-            matched_ranges[byte_range] = line
+        selected = select_idx_messages(selected, forecasts=accum_alts, percentiles=target_perc_values)
 
-    if model in ["hrrr", "urma"] and element in ["precip6hr", "precip24hr", "snow6hr"]:
+    elif model in ["hrrr", "urma"] and element in ["precip6hr", "precip24hr", "snow6hr"]:
         base = os.path.basename(remote_url)
         try:
             fcst_hour = parse_forecast_hour(base)
         except ValueError:
             print("     ❌ Could not determine forecast hour from filename.")
-            return None
-        tr_end = fcst_hour
-        if element == 'precip24hr':
-            tr_start = fcst_hour - 24
-            if tr_end == 24:
-                accum_str = f"0-1 day acc fcst"
-            elif tr_end == 48:
-                accum_str = f"0-2 day acc fcst"
-            elif tr_end == 0:
-                accum_str = f"0-0 day acc fcst"
-            else:
-                accum_str = f"0-{tr_end} hour acc fcst"
-        elif element == 'precip6hr':
-            tr_start = fcst_hour - 6
-            if tr_end == 24:
-                accum_str = f"0-1 day acc fcst"
-            elif tr_end == 48:
-                accum_str = f"0-2 day acc fcst"
-            elif tr_end == 0:
-                accum_str = f"0-0 day acc fcst"
-            else:
-                accum_str = f"0-{tr_end} hour acc fcst"
-        elif element == 'snow6hr':
-            tr_start = fcst_hour - 6
-            if tr_end == 24:
-                accum_str = f"0-1 day acc fcst"
-            elif tr_end == 48:
-                accum_str = f"0-2 day acc fcst"
-            elif tr_end == 0:
-                accum_str = f"0-0 day acc fcst"
-            else:
-                accum_str = f"0-{tr_end} hour acc fcst"
+            return b""
+        # accumulations run from the start of the forecast; 24 and 48 h are labeled in days
+        if fcst_hour in (0, 24, 48):
+            accum_str = f"0-{fcst_hour // 24} day acc fcst"
         else:
-            raise NotImplementedError(f"Adjust your time step for {element} and {model} in download_subset in utils.py")
-        # Compile search patterns
-        search_exprs = [re.escape(s) for s in search_strings]
-        search_pattern = re.compile("|".join(search_exprs))
-        for n, line in enumerate(lines, start=1):
-            if exclude_phrases and any(phrase in line for phrase in exclude_phrases):
-                continue
-            if not search_pattern.search(line):
-                continue
-            if accum_str not in line:
-                continue
-            parts = line.split(':')
-            rangestart = int(parts[1])
-
-            if n < len(lines):
-                parts_next = lines[n].split(':')
-                rangeend = int(parts_next[1]) - 1
-            else:
-                rangeend = ''
+            accum_str = f"0-{fcst_hour} hour acc fcst"
+        selected = select_idx_messages(selected, forecasts=[accum_str])
 
-            byte_range = f'{rangestart}-{rangeend}' if rangeend else f'{rangestart}-'
-            matched_ranges[byte_range] = line
-
-    if model in ["hrrr", "urma"] and element not in ["precip6hr", "precip24hr", "snow6hr"]:
+    else:
         # Generic logic for other models: just match search strings
-        exprs = {s: re.compile(re.escape(s)) for s in search_strings}
-        matched_vars = set()
-
-        for n, line in enumerate(lines, start=1):
-            if exclude_phrases and any(phrase in line for phrase in exclude_phrases):
-                continue
-
-            for search_str, expr in exprs.items():
-                if expr.search(line):
-                    matched_vars.add(search_str)
-                    parts = line.split(':')
-                    rangestart = int(parts[1])
-                    if n < len(lines):
-                        parts_next = lines[n].split(':')
-                        rangeend = int(parts_next[1]) - 1
-                    else:
-                        rangeend = ''
-                    byte_range = f'{rangestart}-{rangeend}' if rangeend else f'{rangestart}-'
-                    matched_ranges[byte_range] = line
-
+        matched_vars = {s for s in search_strings
+                        if select_idx_messages(selected, search_strings=[s]).shape[0]}
         if require_all_matches and len(matched_vars) != len(search_strings):
             print(f'      ⚠️ Not all variables matched! Found: {matched_vars}. Skipping {remote_url}.')
-            return None
+            return b""
 
     # Check if anything was found
-    if not matched_ranges:
+    selected = selected.drop_duplicates(["start", "end"])
+    if selected.empty:
         print(f'      ❌ No matches found for {search_strings}')
-        return None
+        return b""
 
     # Download GRIB subset
-    with open(local_filename, 'wb') as f_out:
-        for byteRange in matched_ranges.keys():
-            r = requests.get(remote_url, headers={'Range': f'bytes=' + byteRange})
-            if r.status_code in (200, 206):
-                f_out.write(r.content)
-            else:
-                print(f"      ❌ Failed to download byte range {byteRange}")
+    ranges = idx_byte_ranges(selected)
+    if grib_cache is not None:
+        subset = grib_cache.get(remote_url, ranges)
+        if subset is not None:
+            print(f'      💾 Using cached subset of [{len(ranges)}] fields from {os.path.basename(remote_url)}')
+            return subset
+
+    chunks = fetch_byte_ranges(remote_url, ranges)
+    if chunks is None:
+        return None
+
+    n_requests = len(coalesce_byte_ranges(ranges, config.RANGE_MERGE_GAP))
+    print(f'      ✅ Downloaded [{len(ranges)}] fields in [{n_requests}] requests from {os.path.basename(remote_url)}')
+    subset = b"".join(chunks)
+    if grib_cache is not None:
+        grib_cache.put(remote_url, subset, ranges)
+    return subset
+
+def parse_idx(text):
+    """
+    Parse the text of a wgrib2 .idx file into a table with one row per message:
+    msg, start, end (inclusive, <NA> for the last message), variable, level,
+    forecast, percentile (NaN unless the message is an "N% level"), field
+    (":VAR:level:") and the raw line.
+    """
+    lines = pd.Series(text.strip().split("\n"), dtype=object)
+    lines = lines[lines.str.match(r"[^:]+:\d+:")].reset_index(drop=True)
+    parts = lines.str.split(":", n=6, expand=True).reindex(columns=range(7))
+    inventory = pd.DataFrame({
+        "msg": parts[0],
+        "start": parts[1].astype(np.int64),
+        "variable": parts[3].fillna(""),
+        "level": parts[4].fillna(""),
+        "forecast": parts[5].fillna(""),
+        "line": lines,
+    })
+
+    # a message ends where the next one at a higher offset starts (sub-messages share an offset)
+    starts = inventory["start"].to_numpy()
+    offsets = np.unique(starts)
+    pos = np.searchsorted(offsets, starts, side="right")
+    inventory["end"] = pd.array(
+        np.where(pos < len(offsets), offsets[np.minimum(pos, len(offsets) - 1)] - 1, 0), dtype="Int64")
+    inventory.loc[pos == len(offsets), "end"] = pd.NA
+
+    last_token = lines.str.split(":").str[-1].str.strip()
+    inventory["percentile"] = pd.to_numeric(last_token.str.extract(r"^(\d+)% level", expand=False))
+    inventory["field"] = ":" + inventory["variable"] + ":" + inventory["level"] + ":"
+    return inventory
+
+def idx_cache_path(idx_url):
+    return Path(config.IDX_CACHE) / f"{hashlib.sha1(idx_url.encode()).hexdigest()}.idx"
+
+def fetch_idx_text(idx_url):
+    """
+    Return the text of an .idx file, from the on-disk idx cache (config.IDX_CACHE)
+    when possible. Archived .idx files never change, so cached copies never expire;
+    the cache is trimmed least-recently-used to config.IDX_CACHE_BYTES.
+    Returns None if the file can't be fetched.
+    """
+    path = idx_cache_path(idx_url)
+    try:
+        text = path.read_text()
+        os.utime(path)  # mark as recently used
+        return text
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+
+    r = http_get(idx_url)
+    if not r.ok:
+        print(f'     ❌ Could not get index file: {idx_url} ({r.status_code} {r.reason})')
+        return None
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(r.text)
+    os.replace(tmp_path, path)
+    with idx_cache_lock:
+        if idx_cache_size["bytes"] is None:
+            idx_cache_size["bytes"] = sum(f.stat().st_size for f in path.parent.glob("*.idx"))
+        else:
+            idx_cache_size["bytes"] += path.stat().st_size
+        if idx_cache_size["bytes"] > config.IDX_CACHE_BYTES:
+            idx_cache_size["bytes"] = evict_lru_files(path.parent, config.IDX_CACHE_BYTES, "*.idx")
+    return r.text
+
+def evict_lru_files(cache_dir, max_bytes, pattern="*"):
+    """Delete the least recently used files matching pattern until cache_dir fits in max_bytes; returns the new total."""
+    entries = []
+    for f in Path(cache_dir).glob(pattern):
+        try:
+            stat = f.stat()
+            entries.append((stat.st_mtime, stat.st_size, f))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, f in sorted(entries, key=lambda e: e[0]):
+        if total <= max_bytes:
+            break
+        f.unlink(missing_ok=True)
+        total -= size
+    return total
+
+def warm_idx_cache(file_urls, max_workers=16):
+    """Prefetch the .idx files for file_urls into the on-disk idx cache in parallel."""
+    idx_urls = [url if url.endswith(".idx") else url + ".idx" for url in file_urls]
+    print(f"🔥 Warming idx cache with {len(idx_urls)} index files...")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(fetch_idx_text, idx_urls))
+    cached = sum(text is not None for text in results)
+    print(f"📋 {cached} index files cached, {len(idx_urls) - cached} unavailable.")
+    return cached
+
+def load_idx_inventory(remote_url):
+    """Fetch and parse remote_url + ".idx", reusing parsed inventories already in memory."""
+    idx_url = remote_url + ".idx"
+    with idx_inventory_lock:
+        if idx_url in idx_inventory_cache:
+            return idx_inventory_cache[idx_url]
+
+    text = fetch_idx_text(idx_url)
+    if text is None:
+        return None
+    inventory = parse_idx(text)
+
+    with idx_inventory_lock:
+        idx_inventory_cache[idx_url] = inventory
+        while len(idx_inventory_cache) > config.IDX_INVENTORY_ENTRIES:
+            idx_inventory_cache.pop(next(iter(idx_inventory_cache)))
+    return inventory
+
+def select_idx_messages(inventory, search_strings=None, exclude_phrases=None,
+                        variables=None, levels=None, forecasts=None, percentiles=None):
+    """
+    Select rows of a parse_idx inventory. Every argument given narrows the selection:
+    - search_strings: any of them appears in ":VAR:level:" (e.g. ':WIND:10 m above')
+    - exclude_phrases: none of them appears anywhere in the idx line
+    - variables / levels / forecasts / percentiles: column value is in the given set
+    """
+    mask = np.ones(len(inventory), dtype=bool)
+    if search_strings is not None:
+        if not search_strings:
+            mask[:] = False
+        else:
+            mask &= inventory["field"].str.contains("|".join(re.escape(s) for s in search_strings)).to_numpy()
+    if exclude_phrases:
+        mask &= ~inventory["line"].str.contains("|".join(re.escape(s) for s in exclude_phrases)).to_numpy()
+    if variables is not None:
+        mask &= inventory["variable"].isin(list(variables)).to_numpy()
+    if levels is not None:
+        mask &= inventory["level"].isin(list(levels)).to_numpy()
+    if forecasts is not None:
+        mask &= inventory["forecast"].isin(list(forecasts)).to_numpy()
+    if percentiles is not None:
+        mask &= inventory["percentile"].isin(list(percentiles)).to_numpy()
+    return inventory[mask]
+
+def idx_byte_ranges(selected):
+    """(start, end) byte ranges of selected inventory rows, end=None for the last message."""
+    return [(int(start), None if pd.isna(end) else int(end))
+            for start, end in zip(selected["start"], selected["end"])]
+
+def coalesce_byte_ranges(ranges, max_gap=0):
+    """
+    Merge byte ranges that overlap or sit within max_gap bytes of each other.
+
+    ranges: list of (start, end) with inclusive end, or end=None for "to end of file".
+    Returns a list of (start, end, members) sorted by start, where members are the
+    (index, start, end) of the original ranges covered by that block.
+    """
+    blocks = []
+    for i, (start, end) in sorted(enumerate(ranges), key=lambda item: item[1][0]):
+        if blocks:
+            block_start, block_end, members = blocks[-1]
+            if block_end is None or start <= block_end + 1 + max_gap:
+                new_end = None if (block_end is None or end is None) else max(block_end, end)
+                blocks[-1] = (block_start, new_end, members + [(i, start, end)])
+                continue
+        blocks.append((start, end, [(i, start, end)]))
+    return blocks
+
+def format_byte_range(start, end):
+    return f"{start}-{end}" if end is not None else f"{start}-"
+
+def parse_multipart_byteranges(content, content_type):
+    """Split a multipart/byteranges response body into {(start, end): bytes}."""
+    boundary = re.search(r'boundary="?([^";]+)"?', content_type).group(1).encode()
+    parts = {}
+    for part in content.split(b"--" + boundary):
+        head, sep, body = part.partition(b"\r\n\r\n")
+        match = re.search(rb"Content-Range:\s*bytes\s+(\d+)-(\d+)/", head, re.IGNORECASE)
+        if not sep or not match:
+            continue
+        start, end = int(match.group(1)), int(match.group(2))
+        parts[(start, end)] = body[:end - start + 1]
+    return parts
+
+def fetch_byte_ranges(url, ranges, max_gap=None, max_workers=None, multirange=None):
+    """
+    Fetch byte ranges of url and return their contents in the original order.
+
+    Nearby ranges are merged into one request (config.RANGE_MERGE_GAP), and the
+    merged blocks are fetched concurrently. With multirange, all blocks are first
+    requested in a single multi-range GET; servers that don't honor it (S3 answers
+    with the whole object) fall back to one request per block.
+    Returns None if any block fails.
+    """
+    max_gap = config.RANGE_MERGE_GAP if max_gap is None else max_gap
+    max_workers = max_workers or config.RANGE_FETCH_WORKERS
+    multirange = config.MULTIRANGE_REQUESTS if multirange is None else multirange
+    blocks = coalesce_byte_ranges(ranges, max_gap)
+    block_data = None
+
+    if multirange and len(blocks) > 1:
+        spec = ",".join(format_byte_range(start, end) for start, end, _ in blocks)
+        try:
+            with http_get(url, headers={"Range": f"bytes={spec}"}, stream=True) as r:
+                content_type = r.headers.get("Content-Type", "")
+                if r.status_code == 206 and content_type.startswith("multipart/byteranges"):
+                    parts = parse_multipart_byteranges(r.content, content_type)
+                    block_data = []
+                    for start, end, _ in blocks:
+                        data = next((v for (s, e), v in parts.items() if s == start and (end is None or e == end)), None)
+                        if data is None:
+                            block_data = None
+                            break
+                        block_data.append(data)
+        except requests.RequestException as e:
+            print(f"      ⚠️ Multi-range request failed for {os.path.basename(url)}: {e}")
+
+    if block_data is None:
+        def fetch_block(block):
+            start, end, _ = block
+            byte_range = format_byte_range(start, end)
+            try:
+                r = http_get(url, headers={"Range": f"bytes={byte_range}"})
+            except requests.RequestException as e:
+                print(f"      ❌ Failed to download byte range {byte_range}: {e}")
                 return None
+            if r.status_code == 206:
+                return r.content
+            if r.status_code == 200:
+                # server ignored the Range header and sent the whole object
+                return r.content[start:None if end is None else end + 1]
+            print(f"      ❌ Failed to download byte range {byte_range} ({r.status_code})")
+            return None
 
-    print(f'      ✅ Downloaded [{len(matched_ranges)}] fields from {os.path.basename(remote_url)} → {local_filename}')
-    return local_filename if os.path.exists(local_filename) else None
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(blocks))) as executor:
+            block_data = list(executor.map(fetch_block, blocks))
+        if any(data is None for data in block_data):
+            return None
+
+    chunks = [None] * len(ranges)
+    for (block_start, _, members), data in zip(blocks, block_data):
+        for i, start, end in members:
+            offset = start - block_start
+            chunks[i] = data[offset:None if end is None else offset + end - start + 1]
+    return chunks
+
+def split_grib_messages(buffer):
+    """Split concatenated GRIB bytes into individual messages using the section 0 lengths."""
+    messages = []
+    buffer = bytes(buffer)
+    view = memoryview(buffer)
+    pos = buffer.find(b"GRIB")
+    while 0 <= pos < len(buffer):
+        edition = view[pos + 7]
+        if edition == 2:
+            length = int.from_bytes(view[pos + 8:pos + 16], "big")
+        else:
+            length = int.from_bytes(view[pos + 4:pos + 7], "big")
+        if length <= 0 or pos + length > len(buffer):
+            print(f"⚠️ Truncated GRIB message at byte {pos}")
+            break
+        messages.append(bytes(view[pos:pos + length]))
+        pos = buffer.find(b"GRIB", pos + length)
+    return messages
+
+def load_grib_messages(buffer):
+    """Decode in-memory GRIB bytes into pygrib messages (no temp file)."""
+    return [pygrib.fromstring(m) for m in split_grib_messages(buffer)]
+
+# (discipline, parameterCategory, parameterNumber) -> name, for parameters cfgrib leaves
+# unnamed whatever shortName the installed eccodes tables give them; config keys on these names
+GRIB_PARAMETER_NAMES = {
+    (0, 1, 29): "unknown",  # ASNOW, total snowfall
+}
+
+def grib_var_name(grb):
+    """The variable name cfgrib would give a message (cfVarName), falling back to shortName."""
+    if all(grb.has_key(key) for key in ("discipline", "parameterCategory", "parameterNumber")):
+        triplet = (grb["discipline"], grb["parameterCategory"], grb["parameterNumber"])
+        if triplet in GRIB_PARAMETER_NAMES:
+            return GRIB_PARAMETER_NAMES[triplet]
+    for key in ("cfVarName", "shortName"):
+        if grb.has_key(key) and grb[key] not in ("", "unknown", None):
+            return grb[key]
+    return "unknown"
 
 def parse_date_and_time_from_url(remote_url, model):
     url_parts = remote_url.split('/')
@@ -640,293 +1961,506 @@ def add_interval_precip_from_total(
             .reset_index(drop=True)
         )
 
-def extract_model_subset_parallel(file_urls, station_df, search_strings, element, model, config):
+def model_forecast_hour(local_file, model):
+    """Pull the forecast hour out of a downloaded model file name."""
+    base = os.path.basename(local_file)
+    if model in ['nbm', 'nbmqmd', 'nbmqmd_exp']:
+        return int(re.search(r"\.f(\d{3})\.", base).group(1))
+    elif model == 'hrrr':
+        match = re.search(r"f(\d{2,3})", base)
+        if match:
+            return int(match.group(1))
+        raise ValueError(f"Could not extract forecast hour from {local_file}")
+    elif model == 'urma':
+        return 0
+    print(f'File pattern matching not yet set up for {model}')
+    raise NotImplementedError
+
+# cfgrib filter_by_keys per model (also honoured by the pygrib reader)
+MODEL_FILTER_KEYS = {
+    "urma": {
+        "typeOfLevel": "heightAboveGround",
+        "stepType": "instant",
+        "level": 10
+    }
+}
+
+def open_model_dataset(local_file, model):
+    """Open a downloaded model file with cfgrib using the per-model backend settings."""
+    backend_kwargs = {"indexpath": "", "errors": "ignore"}
+    if model in MODEL_FILTER_KEYS:
+        backend_kwargs["filter_by_keys"] = MODEL_FILTER_KEYS[model]
+    return xr.open_dataset(local_file, engine="cfgrib", backend_kwargs=backend_kwargs, decode_timedelta=True)
+
+def message_valid_time(grb):
+    """Valid time of a message (end of the period for accumulations/max/min)."""
+    return datetime.strptime(f"{grb['validityDate']}{grb['validityTime']:04d}", "%Y%m%d%H%M")
+
+def read_grib_fields(source, names, filter_keys=None):
+    """
+    Lightweight GRIB reader: iterate the messages with pygrib and return raw NumPy
+    fields for the requested variable names (cfgrib naming), without building an
+    xarray Dataset.
+
+    source: GRIB file path or in-memory GRIB bytes
+    names: variable names as cfgrib would call them (HERBIE_RENAME_MAP / NDFD_ELEMENT_STRINGS keys)
+    filter_keys: optional GRIB key/value filter, same meaning as cfgrib's filter_by_keys
+
+    Returns (fields, valid_times, steps): fields maps name -> float32 array shaped
+    (step, y, x), ordered by valid time; valid_times/steps belong to the first
+    requested name found.
+    """
+    grbs = load_grib_messages(source) if isinstance(source, bytes) else pygrib.open(source)
+    by_name = {}
+    try:
+        for grb in grbs:
+            if filter_keys and any(not grb.has_key(k) or grb[k] != v for k, v in filter_keys.items()):
+                continue
+            name = grib_var_name(grb)
+            if name not in names:
+                continue
+            valid = message_valid_time(grb)
+            # first message wins when a name repeats for the same time (cfgrib errors="ignore" behaviour)
+            if valid not in by_name.setdefault(name, {}):
+                values = np.ma.filled(grb.values.astype(np.float32), np.nan)
+                by_name[name][valid] = (grb.analDate, values)
+    finally:
+        if not isinstance(source, bytes):
+            grbs.close()
+
+    fields, valid_times, steps = {}, None, None
+    for name in names:
+        if name not in by_name:
+            continue
+        times = sorted(by_name[name])
+        fields[name] = np.stack([by_name[name][t][1] for t in times])
+        if valid_times is None:
+            valid_times = pd.DatetimeIndex(times)
+            steps = pd.TimedeltaIndex([t - by_name[name][t][0] for t in times])
+    return fields, valid_times, steps
+
+def decode_model_fields(local_file, model, rename_map, subset=None):
+    """
+    Decode the fields of one downloaded model file.
+
+    If subset (GRIB bytes) is given it is decoded in memory instead of reading local_file.
+    Returns (fields, valid_time): fields maps the rename_map key (or the percentile
+    for nbmqmd) to its decoded array.
+    """
+    # probabilistic data is processed with pygrib due to issues with cfgrib
+    if model in ['nbmqmd', 'nbmqmd_exp']:
+        grbs = load_grib_messages(subset) if subset is not None else list(pygrib.open(local_file))
+        valid_time = pd.to_datetime(grbs[1].validDate)
+        fields = {int(g.percentileValue): g.values for g in grbs if hasattr(g, "percentileValue")}
+    elif subset is not None or config.GRIB_READERS.get(model, "cfgrib") == "pygrib":
+        fields, valid_times, _ = read_grib_fields(
+            subset if subset is not None else local_file,
+            list(rename_map),
+            filter_keys=MODEL_FILTER_KEYS.get(model),
+        )
+        if valid_times is None:
+            raise ValueError(f"None of {list(rename_map)} found in {local_file}")
+        valid_time = valid_times[0]
+    else:
+        ds = open_model_dataset(local_file, model)
+        valid_time = pd.to_datetime(ds.valid_time.values)
+        fields = {grib_var: ds[grib_var].values for grib_var in rename_map if grib_var in ds}
+    return fields, valid_time
+
+def extract_model_file(local_file, stids, iy_arr, ix_arr, element, model, rename_map, conversion_map,
+                       subset=None, source_url=None, grid=None, field_cache=None):
+    """
+    Decode one downloaded model file and gather every field at the given station indices.
+
+    If subset (GRIB bytes) is given it is decoded in memory and local_file is only
+    used as the name to parse the forecast hour from (e.g. the remote URL).
+    If field_cache is given, the decoded fields are stored under source_url.
+
+    Returns a dict of column arrays (one row per station), or None if the
+    element/model combination produces no rows.
+    """
+    fields, valid_time = decode_model_fields(local_file, model, rename_map, subset)
+    if field_cache is not None and source_url:
+        field_cache.put(source_url, element, fields, pd.DatetimeIndex([valid_time]), None, grid)
+    return model_station_columns(fields, valid_time, model_forecast_hour(local_file, model),
+                                 stids, iy_arr, ix_arr, element, model, rename_map, conversion_map)
+
+def model_station_columns(fields, valid_time, forecast_hour, stids, iy_arr, ix_arr, element, model, rename_map, conversion_map):
+    """
+    Gather decoded model fields at all stations with one indexed read per field
+    and apply renames and unit conversions column-wise.
+    Returns a dict of column arrays (one row per station), or None if the
+    element/model combination produces no rows.
+    """
+    n_stn = len(stids)
+
+    columns = {
+        "station_id": stids,
+        "init_time": np.full(n_stn, (valid_time - pd.to_timedelta(forecast_hour, unit="h")).to_datetime64(), dtype="datetime64[ns]"),
+        "valid_time": np.full(n_stn, valid_time.to_datetime64(), dtype="datetime64[ns]"),
+        "forecast_hour": np.full(n_stn, forecast_hour, dtype=np.int64),
+    }
+    values = {key: gather_station_values(field, iy_arr, ix_arr)[:, 0] for key, field in fields.items()}
+
+    if model in ['nbmqmd', 'nbmqmd_exp']:
+        for perc, vals in values.items():
+            if element in ["precip24hr", "precip6hr"]:
+                columns[f"qpf_p{perc}"] = np.round(vals * conversion_map[element], 2)
+            elif element in ["maxt", "mint"]:
+                columns[f"{element}_p{perc}"] = np.round(K_to_F(vals), 2)
+            elif element == "Wind":
+                columns[f"wind_p{perc}"] = np.round(MS_to_KTS(vals), 2)
+            elif element == "Gust":
+                columns[f"gust_p{perc}"] = np.round(MS_to_KTS(vals), 2)
+            else:
+                raise NotImplementedError(f"Unit conversions not set up for {element} in {model}.  Check HERBIE_UNIT_CONVERSIONS in archiver_config.py")
+    elif model in ['nbm', 'urma']:
+        for grib_var, vals in values.items():
+            renamed_var = rename_map[grib_var]
+            if "deg" in renamed_var:
+                columns[renamed_var] = np.round(vals, 0)
+            else:
+                columns[renamed_var] = np.round(vals * conversion_map.get(renamed_var, 1.0), 2)
+    elif model == 'hrrr':
+        if element == "Wind":
+            converted = {rename_map[v]: vals * conversion_map.get(rename_map[v], 1.0) for v, vals in values.items()}
+            u = converted.pop("u_wind", None)
+            v = converted.pop("v_wind", None)
+            for renamed_var, vals in converted.items():
+                columns[renamed_var] = np.round(vals, 2)
+            # If both u and v exist, compute speed and direction
+            if u is not None and v is not None:
+                columns["wind_dir_deg"] = np.round((270 - np.degrees(np.arctan2(v, u))) % 360, 0)
+                columns["wind_speed_kt"] = np.round(np.sqrt(u**2 + v**2), 2)
+        elif element == 'precip6hr':
+            for grib_var, vals in values.items():
+                columns[rename_map[grib_var]] = np.round(MM_to_IN(vals), 2)
+        elif element == 'snow6hr':
+            for grib_var, vals in values.items():
+                columns[rename_map[grib_var]] = np.round(M_to_IN(vals), 1)
+        else:
+            return None
+    return columns
+
+def decode_model_file(task):
+    """
+    Process-pool entry point for extract_model_file. Takes a task dict of
+    extract_model_file kwargs and returns (local_file, columns, error) so
+    failures don't kill the pool.
+    """
+    local_file = task["local_file"]
+    try:
+        return local_file, extract_model_file(**task), None
+    except Exception as e:
+        return local_file, None, str(e)
+
+def decode_pool_context():
+    """
+    Start method for decode process pools. Workers start lazily while download (and
+    s3fs IO) threads hold locks, so they come from a forkserver rather than a fork
+    of this process.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def decode_model_files(tasks, workers):
+    """
+    Run decode_model_file over tasks, in a process pool when workers > 1.
+    Results come back in task order regardless of completion order. A task whose
+    worker died (e.g. a GRIB decoder crash breaking the pool) comes back as an error
+    without losing the results already decoded.
+    """
+    results = [None] * len(tasks)
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=decode_pool_context()) as executor:
+            futures = {executor.submit(decode_model_file, task): n for n, task in enumerate(tasks)}
+            for i, future in enumerate(as_completed(futures), 1):
+                n = futures[future]
+                try:
+                    results[n] = future.result()
+                except Exception as e:
+                    results[n] = (tasks[n]["local_file"], None, f"decode worker failed: {e!r}")
+                print(f"✅ Decoded {i}/{len(tasks)} files.")
+    else:
+        for n, task in enumerate(tasks):
+            print(f"Now processing {task['local_file']}...")
+            results[n] = decode_model_file(task)
+    return results
+
+def stream_download_decode(file_urls, download_file, make_task, download_workers, decode_workers, max_files_on_disk,
+                           submit_order=None, decode_fn=decode_model_file):
+    """
+    Pipelined download→decode. Each file is handed to a decoder as soon as its
+    download finishes and is deleted right after extraction. A semaphore keeps at
+    most max_files_on_disk finished files queued for or in decoding; a download
+    thread holding a finished file waits for a slot before taking its next URL, so
+    downloads wait for the decoders instead of filling the temp dir with the whole
+    chunk. The semaphore is taken after the download, outside any concurrency
+    controller wrapped around download_file, so it never caps the controller's
+    in-flight downloads.
+
+    download_file(url) -> (url, local file path, tuple of paths, in-memory GRIB bytes, or None)
+    make_task(url, downloaded) -> task dict for decode_fn (decode_model_file by default)
+
+    submit_order optionally gives the order (indices into file_urls) to start downloads in.
+
+    Returns decode_fn results in file_urls order, None for files that never reached a decoder.
+    """
+    slots = threading.BoundedSemaphore(max_files_on_disk)
+    results = [None] * len(file_urls)
+
+    def finish(n, local_file, result):
+        results[n] = result
+        for path in (local_file if isinstance(local_file, tuple) else (local_file,)):
+            if isinstance(path, str):
+                Path(path).unlink(missing_ok=True)
+        slots.release()
+
+    def on_decoded(n, local_file):
+        def callback(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = (file_urls[n], None, str(e))
+            finish(n, local_file, result)
+        return callback
+
+    def fetch(n, url):
+        try:
+            _, local_file = download_file(url)
+        except Exception as e:
+            print(f"❌ Exception downloading {url}: {e}")
+            local_file = None
+        if local_file:
+            # taken after the download, so waiting on the decoders never holds a download slot
+            slots.acquire()
+        return n, local_file
+
+    decode_pool = None
+    if decode_workers > 1:
+        decode_pool = ProcessPoolExecutor(max_workers=decode_workers, mp_context=decode_pool_context())
+    try:
+        with ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+            order = submit_order if submit_order is not None else range(len(file_urls))
+            futures = [download_pool.submit(fetch, n, file_urls[n]) for n in order]
+            for i, future in enumerate(as_completed(futures), 1):
+                n, local_file = future.result()
+                print(f"✅ Downloaded {i}/{len(file_urls)} files.")
+                if not local_file:
+                    continue
+                try:
+                    task = make_task(file_urls[n], local_file)
+                except Exception as e:
+                    print(f"❌ Failed to read grid from {file_urls[n]}: {e}")
+                    finish(n, local_file, None)
+                    continue
+                if decode_pool:
+                    try:
+                        future = decode_pool.submit(decode_fn, task)
+                    except Exception as e:
+                        print(f"❌ Failed to queue {file_urls[n]} for decoding: {e}")
+                        finish(n, local_file, None)
+                        continue
+                    future.add_done_callback(on_decoded(n, local_file))
+                else:
+                    print(f"Now processing {task['local_file']}...")
+                    finish(n, local_file, decode_fn(task))
+    finally:
+        if decode_pool:
+            decode_pool.shutdown(wait=True)
+    return results
+
+def columns_to_dataframe(all_columns):
+    """Stack per-file column dicts into one DataFrame; columns missing from a file become NaN."""
+    if not all_columns:
+        return pd.DataFrame()
+    return pd.concat([pd.DataFrame(c) for c in all_columns], ignore_index=True)
+
+def extract_model_subset_parallel(file_urls, station_df, search_strings, element, model, config, field_cache=None, file_sizes=None,
+                                  grib_cache=None, return_failed=False):
+    """
+    Download, decode and extract station rows from model files. With return_failed,
+    returns (df, file_urls whose download or decode failed) instead of just df; files
+    with nothing to extract don't count as failed. A model run is then kept or retried
+    as a whole: when one of its files failed, the rest of the run is dropped and
+    reported as failed too, since interval precip/snow is differenced across its
+    forecast hours.
+    """
     rename_map = config.HERBIE_RENAME_MAP[element][model]
     conversion_map = config.HERBIE_UNIT_CONVERSIONS[element].get(model, {})
     print(f"Conversion map is: {conversion_map}")
     # Stage 1: Download all files in parallel
-    local_files = []
     download_results = {}
+    no_data = set()
     temp_download_dir = tempfile.mkdtemp(prefix="model_downloads_")
     print(f"📁 Using temp folder: {temp_download_dir}")
 
     def download_file(remote_url):
-        remote_file = os.path.basename(remote_url)
-        date_tag, time_tag = parse_date_and_time_from_url(remote_url, model)
-        #print(f"Date tag is: {date_tag} and time tag is {time_tag}")
-        local_file = os.path.join(temp_download_dir, f"{date_tag}_{time_tag}_{remote_file}")  # or whatever your directory is
-        if model == 'urma':
-            try:
-                r = requests.get(remote_url)
-                if r.status_code in (200, 206):
-                    with open(local_file, 'wb') as f:
-                        f.write(r.content)
-                    return (remote_url, local_file)
-                else:
-                    print(f"❌ Failed to download URMA file: {remote_url}")
-                    return (remote_url, None)
-            except Exception as e:
-                print(f"❌ Exception downloading URMA file: {e}")
+        if not search_strings:
+            # nothing to subset on; fetch the whole file
+            remote_file = os.path.basename(remote_url)
+            date_tag, time_tag = parse_date_and_time_from_url(remote_url, model)
+            local_file = os.path.join(temp_download_dir, f"{date_tag}_{time_tag}_{remote_file}")
+            cached = grib_cache.get_path(remote_url) if grib_cache is not None else None
+            if cached is not None:
+                return (remote_url, grib_cache.link(cached, local_file))
+            if download_whole_file(remote_url, local_file) is None:
                 return (remote_url, None)
-        elif model == 'nbmqmd':
-            downloaded_file = download_subset(
-                remote_url=remote_url,
-                local_filename=local_file,
-                search_strings=search_strings,
-                model=model,
-                element=element,
-                require_all_matches=True,
-                #required_phrases=config.HERBIE_REQUIRED_PHRASES[element][model],
-                #exclude_phrases=config.HERBIE_EXCLUDE_PHRASES[element][model],
-            )
-            return (remote_url, downloaded_file)
-        elif model == 'nbmqmd_exp':
-            downloaded_file = download_subset(
-                remote_url=remote_url,
-                local_filename=local_file,
-                search_strings=search_strings,
-                model=model,
-                element=element,
-                require_all_matches=True,
-                #required_phrases=config.HERBIE_REQUIRED_PHRASES[element][model],
-                #exclude_phrases=config.HERBIE_EXCLUDE_PHRASES[element][model],
-            )
-            return (remote_url, downloaded_file)
-        else:          
-            downloaded_file = download_subset(
-                remote_url=remote_url,
-                local_filename=local_file,
-                search_strings=search_strings,
-                model=model,
-                element=element,
-                require_all_matches=True,
-                required_phrases=config.HERBIE_REQUIRED_PHRASES[element][model],
-                exclude_phrases=config.HERBIE_EXCLUDE_PHRASES[element][model],
-            )
-            return (remote_url, downloaded_file)
+            if grib_cache is not None:
+                grib_cache.put_file(remote_url, local_file)
+            return (remote_url, local_file)
+
+        subset_kwargs = dict(
+            search_strings=search_strings,
+            model=model,
+            element=element,
+            require_all_matches=True,
+            grib_cache=grib_cache,
+        )
+        if model not in ['nbmqmd', 'nbmqmd_exp']:
+            subset_kwargs["required_phrases"] = config.HERBIE_REQUIRED_PHRASES[element][model]
+            subset_kwargs["exclude_phrases"] = config.HERBIE_EXCLUDE_PHRASES[element][model]
 
-    print("📥 Starting parallel downloads...")
-    with ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
-        futures = [executor.submit(download_file, url) for url in file_urls]
-        downloaded_files = []
-        for i, future in enumerate(as_completed(futures), 1):
-            remote_url, local_file = future.result()
-            if local_file:
-                downloaded_files.append(local_file)
-            print(f"✅ Downloaded {i}/{len(file_urls)} files.")
-
-    print(f"📂 {len(downloaded_files)} files downloaded. Now starting data extraction...")
-
-    # Stage 2: Process each file (could also be parallel if needed, but safe to do serially)
-    station_index_cache = {}  # move it here so it's scoped properly
-    all_records = []
-    # probabilistic data is processed differently due to issues with cfgrib
-    if model not in  ['nbmqmd', 'nbmqmd_exp']:
-        for i, local_file in enumerate(downloaded_files):
-            print(f"Now processing {local_file}...")
+        if config.IN_MEMORY_GRIB:
+            # keep the subset as bytes; decoded straight from memory
+            downloaded = fetch_subset_bytes(remote_url, **subset_kwargs)
+        else:
+            remote_file = os.path.basename(remote_url)
+            date_tag, time_tag = parse_date_and_time_from_url(remote_url, model)
+            #print(f"Date tag is: {date_tag} and time tag is {time_tag}")
+            local_file = os.path.join(temp_download_dir, f"{date_tag}_{time_tag}_{remote_file}")  # or whatever your directory is
+            downloaded = download_subset(remote_url=remote_url, local_filename=local_file, **subset_kwargs)
+        if downloaded == b"":
+            # nothing to extract from this file; not a failure
+            no_data.add(remote_url)
+            return (remote_url, None)
+        return (remote_url, downloaded)
+
+    # Station indices are resolved in this process (grid keys only, cached per grid)
+    # so decode workers only receive the index arrays.
+    stids = station_df["stid"].to_numpy()
+
+    def make_task(remote_url, downloaded):
+        # downloaded is either a local file path or the in-memory GRIB subset
+        if isinstance(downloaded, bytes):
+            grb = load_grib_messages(downloaded)[0]
+            grid, latlons = read_grid_definition(grb), grb.latlons
+        else:
+            grid, latlons = read_grid_definition_from_file(downloaded)
+        iy_arr, ix_arr = get_station_indices(station_df, grid, latlons)
+        if field_cache is not None:
+            field_cache.put_grid(grid, latlons)
+        return dict(
+            local_file=remote_url if isinstance(downloaded, bytes) else downloaded,
+            stids=stids, iy_arr=iy_arr, ix_arr=ix_arr,
+            element=element, model=model, rename_map=rename_map, conversion_map=conversion_map,
+            subset=downloaded if isinstance(downloaded, bytes) else None,
+            source_url=remote_url, grid=grid, field_cache=field_cache,
+        )
+
+    # one slot per file_urls entry, so the output order doesn't depend on cache hits or completion order
+    file_columns = [None] * len(file_urls)
+    pending = list(range(len(file_urls)))
+
+    # Files already in the decoded-field cache are re-extracted from memory-mapped arrays
+    if field_cache is not None:
+        pending = []
+        for n, url in enumerate(file_urls):
+            entry = field_cache.get(url, element)
+            if entry is None:
+                pending.append(n)
+                continue
+            fields, valid_times, _, grid = entry
             try:
-                if model == "nbm":
-                    ds = xr.open_dataset(
-                        local_file,
-                        engine="cfgrib",
-                        backend_kwargs={
-                            "indexpath": "",
-                            "errors": "ignore"
-                            },
-                        decode_timedelta=True,
-                    )
-                elif model == "hrrr":
-                    ds = xr.open_dataset(
-                        local_file,
-                        engine="cfgrib",
-                        backend_kwargs={
-                            "indexpath": "",
-                            "errors": "ignore"
-                            },
-                        decode_timedelta=True,
-                    )
-                else:
-                    ds = xr.open_dataset(
-                        local_file,
-                        engine="cfgrib",
-                        backend_kwargs={
-                            "filter_by_keys": {
-                                "typeOfLevel": "heightAboveGround",
-                                "stepType": "instant",
-                                "level": 10
-                            },
-                            "indexpath": "",
-                            "errors": "ignore"
-                        },
-                        decode_timedelta=True
-                    )
-                lats = ds.latitude.values
-                lons = ds.longitude.values  # wrap longitude
-                #print(f"We are looking at other lons...")
-                #print(f"Lons are: {lons[150,150]}")
-                #tree, grid_shape = build_kdtree(lats, lons)
-                valid_time = pd.to_datetime(ds.valid_time.values)
-                if model == 'nbm':
-                    forecast_hour = int(re.search(r"\.f(\d{3})\.", os.path.basename(local_file)).group(1))
-                elif model == 'nbmqmd':
-                    forecast_hour = int(re.search(r"\.f(\d{3})\.", os.path.basename(local_file)).group(1))
-                elif model == 'hrrr':
-                    match = re.search(r"f(\d{2,3})", os.path.basename(local_file))
-                    if match:
-                        forecast_hour = int(match.group(1))
-                    else:
-                        raise ValueError(f"Could not extract forecast hour from {local_file}")
-                elif model == 'urma':
-                    forecast_hour = 0
-                else:
-                    print(f'File pattern matching not yet set up for {model}')
-                    raise NotImplementedError
-
-                for _, row in station_df.iterrows():
-                    stid = row["stid"]
-                    lat, lon = row["latitude"], row["longitude"]
-
-                    if stid in station_index_cache:
-                            iy, ix = station_index_cache[stid]
-                    else:
-                        #iy, ix = query_kdtree(tree, grid_shape, lat, lon)
-                        iy, ix = ll_to_index(lat, lon, lats, lons)
-                        station_index_cache[stid] = (iy, ix)
-
-                    record = {
-                        "station_id": stid,
-                        "init_time": valid_time - pd.to_timedelta(forecast_hour, unit="h"),
-                        "valid_time": valid_time,
-                        "forecast_hour": forecast_hour,
-                    }
-                    if model == 'nbm' or model == 'urma':
-                        for grib_var, renamed_var in rename_map.items():
-                            if grib_var not in ds:
-                                continue
-                            val = ds[grib_var].values[iy, ix]
-                            factor = conversion_map.get(renamed_var, 1.0)
-                            if pd.notnull(val):
-                                if "deg" in renamed_var:
-                                    record[renamed_var] = round(float(val), 0)
-                                else:
-                                    record[renamed_var] = round(float(val * factor), 2)
-
-                        all_records.append(record)
-
-                    elif model == 'hrrr':
-                        if element == "Wind":
-                            u = v = None  # Default to None in case either component is missing
-
-                            for grib_var, renamed_var in rename_map.items():
-                                if grib_var not in ds:
-                                    continue
-                                val = ds[grib_var].values[iy, ix]
-                                factor = conversion_map.get(renamed_var, 1.0)
-                                val = val * factor if pd.notnull(val) else None
-
-                                if renamed_var == "u_wind":
-                                    u = val
-                                elif renamed_var == "v_wind":
-                                    v = val
-                                else:
-                                    if val is not None:
-                                        record[renamed_var] = round(float(val), 2)
-
-                            # If both u and v exist, compute speed and direction
-                            if u is not None and v is not None:
-                                speed = np.sqrt(u**2 + v**2)
-                                direction = (270 - np.degrees(np.arctan2(v, u))) % 360
-                                record["wind_dir_deg"] = round(float(direction), 0)
-                                record["wind_speed_kt"] = round(float(speed), 2)
-
-                            all_records.append(record)  
-                        elif element == 'precip6hr':
-                            for grib_var, renamed_var in rename_map.items():
-                                if grib_var not in ds:
-                                    continue
-                                val = MM_to_IN(ds[grib_var].values[iy, ix])
-                                record[renamed_var] = round(float(val), 2)
-
-                            all_records.append(record)   
-                        elif element == 'snow6hr':
-                            for grib_var, renamed_var in rename_map.items():
-                                if grib_var not in ds:
-                                    continue
-                                val = M_to_IN(ds[grib_var].values[iy, ix])
-                                record[renamed_var] = round(float(val), 1)
-
-                            all_records.append(record)       
+                iy_arr, ix_arr = get_station_indices(station_df, grid, field_cache.grid_latlons(grid))
+                file_columns[n] = model_station_columns(fields, valid_times[0], model_forecast_hour(url, model),
+                                                        stids, iy_arr, ix_arr, element, model, rename_map, conversion_map)
             except Exception as e:
-                print(f"❌ Failed to process {local_file}: {e}")
-    # using pygrib to process nbmqmd files
+                print(f"⚠️ Could not use cached fields for {url}, fetching instead: {e}")
+                pending.append(n)
+        print(f"🗃️ {len(file_urls) - len(pending)}/{len(file_urls)} files served from the field cache.")
+    fetch_urls = [file_urls[n] for n in pending]
+
+    # with known object sizes, start the biggest downloads first so they don't straggle at the end
+    download_order = list(range(len(fetch_urls)))
+    if file_sizes:
+        download_order.sort(key=lambda n: -(file_sizes.get(fetch_urls[n]) or 0))
+        total_mb = sum(file_sizes.get(url) or 0 for url in fetch_urls) / 1e6
+        print(f"📦 {len(fetch_urls)} source files totalling {total_mb:,.0f} MB")
+
+    controller = make_concurrency_controller()
+    download_workers = config.MAX_WORKERS
+    fetch_file = download_file
+    if controller is not None:
+        download_workers = controller.max_limit
+        fetch_file = lambda url: controller.run(download_file, url,
+                                                succeeded=lambda result: result[1] is not None or result[0] in no_data)
+
+    if config.STREAM_DOWNLOADS:
+        print(f"📥 Streaming downloads into decoding (max {config.MAX_FILES_ON_DISK} files on disk)...")
+        results = stream_download_decode(
+            fetch_urls, fetch_file, make_task,
+            download_workers=download_workers,
+            decode_workers=config.DECODE_WORKERS,
+            max_files_on_disk=config.MAX_FILES_ON_DISK,
+            submit_order=download_order,
+        )
     else:
-        for local_file in downloaded_files:
-            print(f"Now processing {local_file}...")
-
+        print("📥 Starting parallel downloads...")
+        with ThreadPoolExecutor(max_workers=download_workers) as executor:
+            futures = [executor.submit(fetch_file, fetch_urls[n]) for n in download_order]
+            for i, future in enumerate(as_completed(futures), 1):
+                remote_url, local_file = future.result()
+                download_results[remote_url] = local_file
+                print(f"✅ Downloaded {i}/{len(fetch_urls)} files.")
+        downloaded_files = [download_results[url] for url in fetch_urls if download_results.get(url)]
+
+        print(f"📂 {len(downloaded_files)} files downloaded. Now starting data extraction...")
+
+        # Stage 2: Decode files in a process pool
+        tasks, task_slots = [], []
+        for n, url in enumerate(fetch_urls):
+            if not download_results.get(url):
+                continue
             try:
-                if model == "nbmqmd" or model == "nbmqmd_exp":
-                    # Parse once
-                    grbs = list(pygrib.open(local_file))
-                    forecast_hour = int(re.search(r"\.f(\d{3})\.", os.path.basename(local_file)).group(1))
-                    valid_time = pd.to_datetime(grbs[1].validDate)
-                    lats, lons = grbs[0].latlons()
-                    #lons = lons - 360
-                    #print(f"Model is nbmqmd")
-                    #print(f"Lons are: {lons[150,150]}")
-                    #tree, grid_shape = build_kdtree(lats, lons)
-                    # Cache all GRIB values by percentile
-                    grib_fields = {}
-                    for g in grbs:
-                        if hasattr(g, "percentileValue"):
-                            #print(g)
-                            grib_fields[int(g.percentileValue)] = g.values
-
-                    # Process all stations
-                    for _, row in station_df.iterrows():
-                        stid = row["stid"]
-                        lat, lon = row["latitude"], row["longitude"]
-
-                        if stid in station_index_cache:
-                            iy, ix = station_index_cache[stid]
-                        else:
-                            #iy, ix = query_kdtree(tree, grid_shape, lat, lon)
-                            #station_index_cache[stid] = (iy, ix)
-                            iy, ix = ll_to_index(lat, lon, lats, lons)
-                            station_index_cache[stid] = (iy, ix)
-                        record = {
-                            "station_id": stid,
-                            "init_time": valid_time - pd.to_timedelta(forecast_hour, unit="h"),
-                            "valid_time": valid_time,
-                            "forecast_hour": forecast_hour,
-                        }
-
-                        for perc, values in grib_fields.items():
-                            if element == "precip24hr":
-                                record[f"qpf_p{perc}"] = round(float(values[iy, ix] * conversion_map[element]), 2)
-                            elif element == "precip6hr":
-                                record[f"qpf_p{perc}"] = round(float(values[iy, ix] * conversion_map[element]), 2)
-                            elif element == "maxt":
-                                record[f"maxt_p{perc}"] = round(float(K_to_F(values[iy, ix])), 2),
-                            elif element == "mint":
-                                record[f"mint_p{perc}"] = round(float(K_to_F(values[iy, ix])), 2)
-                            elif element == "Wind":
-                                record[f"wind_p{perc}"] = round(float(MS_to_KTS(values[iy,ix])),2)
-                            elif element == "Gust":
-                                record[f"gust_p{perc}"] = round(float(MS_to_KTS(values[iy,ix])),2)
-                                #
-                            else:
-                                raise NotImplementedError(f"Unit conversions not set up for {element} in {model}.  Check HERBIE_UNIT_CONVERSIONS in archiver_config.py")
-                        all_records.append(record)
-                else:
-                    raise NotImplementedError(f"Probabilistic file processing not yet set up for {model}")
+                tasks.append(make_task(url, download_results[url]))
+                task_slots.append(n)
             except Exception as e:
-                print(f"❌ Failed to process {local_file}: {e}")
-    # cleaning up
-    for local_file in downloaded_files:
-        Path(local_file).unlink(missing_ok=True)
+                print(f"❌ Failed to read grid from {url}: {e}")
+        results = [None] * len(fetch_urls)
+        for n, result in zip(task_slots, decode_model_files(tasks, config.DECODE_WORKERS)):
+            results[n] = result
 
-    shutil.rmtree(temp_download_dir)
-    df = pd.DataFrame.from_records(all_records)
+        # cleaning up
+        for local_file in downloaded_files:
+            if isinstance(local_file, str):
+                Path(local_file).unlink(missing_ok=True)
+
+    if controller is not None:
+        print(f"⚙️ Adaptive concurrency: {controller.stats()}")
+    failed = []
+    for n, result in zip(pending, results):
+        if result is None:
+            if file_urls[n] not in no_data:
+                failed.append(file_urls[n])
+            continue
+        local_file, columns, error = result
+        if error:
+            print(f"❌ Failed to process {local_file}: {error}")
+            failed.append(file_urls[n])
+        else:
+            file_columns[n] = columns
+    if return_failed and failed:
+        failed_runs = {parse_date_and_time_from_url(url, model) for url in failed}
+        for n, url in enumerate(file_urls):
+            if url not in failed and url not in no_data and parse_date_and_time_from_url(url, model) in failed_runs:
+                file_columns[n] = None
+                failed.append(url)
+        print(f"⚠️ {len(failed_runs)} model runs had failed files; they will be retried as a whole.")
+    all_columns = [columns for columns in file_columns if columns]
+
+    shutil.rmtree(temp_download_dir, ignore_errors=True)
+    df = columns_to_dataframe(all_columns)
     # logic for creating accum intervals from total precip for models that output only tp
     if model == "hrrr" and element == "precip6hr":
         # Pick the cumulative column name produced by your rename_map
@@ -946,7 +2480,7 @@ def extract_model_subset_parallel(file_urls, station_df, search_strings, element
                 df, total_col=total_col, out_col="snow_6h", hours=6,
                 group_cols=("station_id", "init_time")
             )
-    return df
+    return (df, failed) if return_failed else df
 
 
 ## TODO ADD hrrrak, urma, rrfs